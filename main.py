@@ -15,10 +15,7 @@ class TestHulk(unittest.TestCase):
 
     grammar = gramm_Hulk_LR1()
 
-    lexer = Lexer(
-        build_regex(),
-        EOF,
-    )
+    lexer = Lexer(build_regex(), EOF, cache="lexer.bin", keywords=True)
 
     parser = LR1Parser(grammar, rebuild=False)
     checker = SemanticCheck()
@@ -26,11 +23,10 @@ class TestHulk(unittest.TestCase):
     # --------------------------------Análisis Léxico--------------------------------
 
     tokens = lexer(content)
-    tokentypes = [token.token_type for token in tokens]
 
     # ------------------------------Análisis Sintáctico------------------------------
 
-    parser, operations = parser(tokentypes)
+    parser, operations = parser(tokens)
 
     ast = evaluate_reverse_parse(parser, operations, tokens)
 
@@ -1,3 +1,6 @@
+from array import array
+from src.tools.automatas import CharSet
+
 try:
     import pydot
 except:
@@ -51,29 +54,43 @@ class State:
         return any(s.final for s in states)
 
     def to_deterministic(self, formatter=lambda x: str(x)):
-        closure = self.epsilon_closure
+        """Construcción de subconjuntos. Los estados del DFA ya descubiertos se indexan
+        en un diccionario por el frozenset de sus estados, y la clausura-ε de cada
+        estado se calcula una sola vez (ver `epsilon_closure_by_state`)."""
+        closures = {}
+
+        def closure_of(states):
+            closure = set()
+            for state in states:
+                try:
+                    closure |= closures[state]
+                except KeyError:
+                    closures[state] = frozenset(self.epsilon_closure_by_state(state))
+                    closure |= closures[state]
+            return frozenset(closure)
+
+        closure = closure_of([self])
         start = State(tuple(closure), any(s.final for s in closure), formatter)
 
-        closures = [ closure ]
-        states = [ start ]
-        pending = [ start ]
+        index = { closure: start }
+        pending = [ (start, closure) ]
 
         while pending:
-            state = pending.pop()
-            symbols = { symbol for s in state.state for symbol in s.transitions }
-
-            for symbol in symbols:
-                move = self.move_by_state(symbol, *state.state)
-                closure = self.epsilon_closure_by_state(*move)
-
-                if closure not in closures:
+            state, closure = pending.pop()
+
+            moves = {}
+            for s in closure:
+                for symbol, destinations in s.transitions.items():
+                    moves.setdefault(symbol, set()).update(destinations)
+
+            for symbol, move in moves.items():
+                closure = closure_of(move)
+                try:
+                    new_state = index[closure]
+                except KeyError:
                     new_state = State(tuple(closure), any(s.final for s in closure), formatter)
-                    closures.append(closure)
-                    states.append(new_state)
-                    pending.append(new_state)
-                else:
-                    index = closures.index(closure)
-                    new_state = states[index]
+                    index[closure] = new_state
+                    pending.append((new_state, closure))
 
                 state.add_transition(symbol, new_state)
 
@@ -94,6 +111,10 @@ class State:
             return states[nfa.start], states
         return states[nfa.start]
 
+    def compile(self, tag=lambda state: state.tag, payloads=False):
+        """`CompiledAutomaton` equivalente a este autómata determinístico."""
+        return CompiledAutomaton.from_state(self, tag, payloads)
+
     @staticmethod
     def move_by_state(symbol, *states):
         return { s for state in states if state.has_transition(symbol) for s in state[symbol]}
@@ -102,13 +123,12 @@ class State:
     def epsilon_closure_by_state(*states):
         closure = { state for state in states }
 
-        l = 0
-        while l != len(closure):
-            l = len(closure)
-            tmp = [s for s in closure]
-            for s in tmp:
-                for epsilon_state in s.epsilon_transitions:
-                        closure.add(epsilon_state)
+        pending = list(closure)
+        while pending:
+            for epsilon_state in pending.pop().epsilon_transitions:
+                if epsilon_state not in closure:
+                    closure.add(epsilon_state)
+                    pending.append(epsilon_state)
         return closure
 
     @property
@@ -197,6 +217,166 @@ class State:
     def write_to(self, fname):
         return self.graph().write_svg(fname)
 
+class CompiledAutomaton:
+    """
+    Autómata determinístico compacto. Los estados son enteros (el inicial es el 0) y los
+    símbolos son columnas: `transitions[state * width + column]` es el estado destino o
+    -1 si no hay transición. `final` y `tags` son arreglos paralelos por estado, y
+    `payloads`, si se conservó, guarda el contenido (`State.state`) de cada estado.
+
+    Los recorridos trabajan sobre los arreglos; `self[state]` devuelve una vista
+    `CompiledState` con la interfaz de `State` para depurar.
+    """
+
+    __slots__ = ('symbols', 'columns', 'width', 'transitions', 'final', 'tags', 'payloads')
+
+    def __init__(self, symbols, transitions, final, tags=None, payloads=None):
+        self.symbols = list(symbols)
+        self.columns = { symbol: column for column, symbol in enumerate(self.symbols) }
+        self.width = len(self.symbols)
+        self.transitions = transitions
+        self.final = final
+        self.tags = tags if tags is not None else [ None ] * len(final)
+        self.payloads = payloads
+
+    @staticmethod
+    def from_state(start, tag=lambda state: state.tag, payloads=False):
+        """Numera en anchura los estados alcanzables desde `start`, que debe ser
+        determinístico: sin transiciones ε y con un solo destino por símbolo. La
+        etiqueta de cada estado es `tag(state)`."""
+        states = [ start ]
+        index = { start: 0 }
+        symbols = {}
+
+        for state in states:
+            assert not state.epsilon_transitions, 'The automaton must be deterministic'
+            for symbol, (target,) in state.transitions.items():
+                symbols.setdefault(symbol, len(symbols))
+                if target not in index:
+                    index[target] = len(states)
+                    states.append(target)
+
+        width = len(symbols)
+        transitions = array('i', [-1]) * (len(states) * width)
+        for n, state in enumerate(states):
+            for symbol, (target,) in state.transitions.items():
+                transitions[n * width + symbols[symbol]] = index[target]
+
+        return CompiledAutomaton(
+            symbols,
+            transitions,
+            bytearray(state.final for state in states),
+            [ tag(state) for state in states ],
+            [ state.state for state in states ] if payloads else None,
+        )
+
+    @staticmethod
+    def from_dfa(dfa):
+        """Convierte un `DFA` de `src.tools.automatas`; el estado inicial pasa a ser el 0."""
+        return State.from_nfa(dfa).compile()
+
+    def target(self, state, symbol):
+        """Destino de `state` con `symbol`, o -1. Un carácter que no es símbolo del
+        autómata se busca en sus símbolos `CharSet`."""
+        column = self.columns.get(symbol)
+        if column is None:
+            if not (isinstance(symbol, str) and len(symbol) == 1):
+                return -1
+            charsets = ( c for c, s in enumerate(self.symbols) if isinstance(s, CharSet) and symbol in s )
+            column = next(charsets, None)
+            if column is None:
+                return -1
+        return self.transitions[state * self.width + column]
+
+    def recognize(self, string):
+        state = 0
+        for symbol in string:
+            state = self.target(state, symbol)
+            if state < 0:
+                return False
+        return bool(self.final[state])
+
+    def __len__(self):
+        return len(self.final)
+
+    def __getitem__(self, state):
+        if not 0 <= state < len(self):
+            raise IndexError(state)
+        return CompiledState(self, state)
+
+    def __iter__(self):
+        return (CompiledState(self, state) for state in range(len(self)))
+
+    def graph(self):
+        G = pydot.Dot(rankdir='LR', margin=0.1)
+        G.add_node(pydot.Node('start', shape='plaintext', label='', width=0, height=0))
+
+        for node in self:
+            G.add_node(pydot.Node(node.id, label=node.name, shape='circle', style='bold' if node.final else ''))
+        for node in self:
+            for symbol, end in node.transitions.items():
+                G.add_edge(pydot.Edge(node.id, end.id, label=symbol, labeldistance=2))
+
+        G.add_edge(pydot.Edge('start', 0, label='', style='dashed'))
+        return G
+
+    def _repr_svg_(self):
+        try:
+            return self.graph().create_svg().decode('utf8')
+        except:
+            pass
+
+
+class CompiledState:
+    """Vista de depuración del estado `id` de un `CompiledAutomaton`."""
+
+    __slots__ = ('automaton', 'id')
+
+    def __init__(self, automaton, id):
+        self.automaton = automaton
+        self.id = id
+
+    @property
+    def final(self):
+        return bool(self.automaton.final[self.id])
+
+    @property
+    def tag(self):
+        return self.automaton.tags[self.id]
+
+    @property
+    def state(self):
+        payloads = self.automaton.payloads
+        return self.id if payloads is None else payloads[self.id]
+
+    @property
+    def name(self):
+        return str(self.state)
+
+    @property
+    def transitions(self):
+        automaton = self.automaton
+        row = self.id * automaton.width
+        return {
+            symbol: CompiledState(automaton, automaton.transitions[row + column])
+            for column, symbol in enumerate(automaton.symbols)
+            if automaton.transitions[row + column] >= 0
+        }
+
+    def __getitem__(self, symbol):
+        target = self.automaton.target(self.id, symbol)
+        return None if target < 0 else [ CompiledState(self.automaton, target) ]
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledState) and self.automaton is other.automaton and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'CompiledState({self.id})'
+
+
 def multiline_formatter(state):
     return '\n'.join(str(item) for item in state)
 
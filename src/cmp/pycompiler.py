@@ -287,6 +287,14 @@ class AttributeProduction(Production):
 
 
 class Grammar:
+    # Vistas por id, ver Freeze
+    Symbols = None
+    SymbolIds = None
+    TerminalCount = 0
+    ProductionIds = None
+    LeftIds = None
+    RightIds = None
+    NonTerminalProductions = None
 
     def __init__(self):
 
@@ -303,6 +311,7 @@ class Grammar:
 
     def NonTerminal(self, name, startSymbol=False):
 
+        self._check_mutable()
         name = name.strip()
         if not name:
             raise Exception("Empty name")
@@ -328,6 +337,7 @@ class Grammar:
 
     def Add_Production(self, production):
 
+        self._check_mutable()
         if len(self.Productions) == 0:
             self.pType = type(production)
 
@@ -338,6 +348,7 @@ class Grammar:
 
     def Terminal(self, name):
 
+        self._check_mutable()
         name = name.strip()
         if not name:
             raise Exception("Empty name")
@@ -353,6 +364,57 @@ class Grammar:
 
         return ans
 
+    def _check_mutable(self):
+        if self.IsFrozen:
+            raise Exception("Cannot modify a frozen grammar.")
+
+    @property
+    def IsFrozen(self):
+        return self.Symbols is not None
+
+    def Freeze(self):
+        """
+        Asigna ids enteros densos a los símbolos y producciones y construye las vistas
+        por id. Después la gramática no admite nuevos símbolos ni producciones (una
+        copia, como la aumentada, sí).
+
+        - `Symbols[id]` es el símbolo con ese id y `SymbolIds[symbol]` su id: `EOF` es
+          el 0, le siguen los terminales (ids menores que `TerminalCount`) y luego los
+          no terminales, en el orden en que se definieron.
+        - `Productions[id]` es la producción con ese id y `ProductionIds[production]` su
+          id; `LeftIds[id]` es el id de su cabeza y `RightIds[id]` la tupla de ids de su
+          cuerpo.
+        - `NonTerminalProductions[id]` es la tupla de ids de las producciones del no
+          terminal `id`.
+
+        Los ids solo existen en esta gramática: los símbolos y producciones, que las
+        copias comparten, no se modifican, así que la gramática original se puede
+        seguir extendiendo después de congelar una copia (como la aumentada).
+        """
+        if self.IsFrozen:
+            return self
+
+        symbols = (self.EOF, *self.terminals, *self.nonTerminals)
+        ids = {symbol: id for id, symbol in enumerate(symbols)}
+        productions = {}
+        for id, production in enumerate(self.Productions):
+            productions.setdefault(production, id)
+
+        self.SymbolIds = ids
+        self.TerminalCount = len(self.terminals) + 1
+        self.ProductionIds = productions
+        self.LeftIds = tuple(ids[production.Left] for production in self.Productions)
+        self.RightIds = tuple(
+            tuple(ids[symbol] for symbol in production.Right)
+            for production in self.Productions
+        )
+        by_left = [[] for _ in symbols]
+        for id, left in enumerate(self.LeftIds):
+            by_left[left].append(id)
+        self.NonTerminalProductions = tuple(tuple(ids) for ids in by_left)
+        self.Symbols = symbols
+        return self
+
     def __str__(self):
 
         mul = "%s, "
@@ -496,7 +558,7 @@ class Item:
         return (
             (self.pos == other.pos)
             and (self.production == other.production)
-            and (set(self.lookaheads) == set(other.lookaheads))
+            and (self.lookaheads == other.lookaheads)
         )
 
     def __hash__(self):
@@ -1,3 +1,6 @@
+import sys
+from array import array
+from bisect import bisect_right
 from src.cmp.pycompiler import Production, Sentence, Symbol, EOF, Epsilon
 
 
@@ -150,6 +153,235 @@ class Token:
         return True
 
 
+def lexeme(source, start, end):
+    """
+    Text of `source[start:end]`. Bytes-like buffers are decoded as UTF-8 with
+    invalid sequences replaced, since strings and comments accept any byte.
+    """
+    lex = source[start:end]
+    if isinstance(lex, str):
+        return lex
+    return bytes(lex).decode("utf-8", errors="replace")
+
+
+class LineIndex:
+    """
+    Offsets where each line of a buffer starts. They are collected in a single
+    pass with `find` the first time a location is requested.
+
+    Parameters
+    ----------
+    source : str or bytes-like
+        Buffer whose lines are indexed.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._starts = None
+
+    @property
+    def starts(self):
+        if self._starts is None:
+            source = self.source
+            if isinstance(source, memoryview):
+                source = source.tobytes()
+            newline = "\n" if isinstance(source, str) else b"\n"
+            starts = array("q", [0])
+            find = source.find
+            i = find(newline)
+            while i >= 0:
+                starts.append(i + 1)
+                i = find(newline, i + 1)
+            self._starts = starts
+        return self._starts
+
+    def location(self, offset):
+        """
+        Row and column (both starting at 1) of `offset`. In bytes-like buffers
+        the column counts the characters before `offset` in its line, not the
+        bytes, so it matches the one of the decoded text.
+        """
+        starts = self.starts
+        row = bisect_right(starts, offset)
+        start = starts[row - 1]
+        if isinstance(self.source, str):
+            return row, offset - start + 1
+        return row, len(lexeme(self.source, start, offset)) + 1
+
+
+class SpanToken(Token):
+    """
+    Token that only records where its lexeme lives in the source buffer. Its
+    location is resolved on demand from the buffer's line index.
+
+    Parameters
+    ----------
+    source : str or bytes-like
+        Buffer the token was read from (str, bytes, memoryview or mmap).
+    start : int
+        Offset of the first character of the lexeme.
+    end : int
+        Offset one past the last character of the lexeme.
+    token_type : Enum
+        Token's type.
+    lines : LineIndex, optional
+        Line index of `source`, shared by every token read from it.
+    """
+
+    def __init__(self, source, start, end, token_type, lines=None):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.token_type = token_type
+        self.lines = lines if lines is not None else LineIndex(source)
+
+    @property
+    def lex(self):
+        return lexeme(self.source, self.start, self.end)
+
+    @property
+    def location(self):
+        return self.lines.location(self.start)
+
+
+class SymbolToken(SpanToken):
+    """
+    Token whose lexeme (an identifier or a keyword) is interned in a symbol
+    table.
+
+    Parameters
+    ----------
+    symbols : SymbolTable
+        Symbol table of the compilation.
+    symbol : int
+        Id of the lexeme in `symbols`.
+    """
+
+    def __init__(
+        self, source, start, end, token_type, lines=None, symbols=None, symbol=-1
+    ):
+        SpanToken.__init__(self, source, start, end, token_type, lines)
+        self.symbols = symbols
+        self.symbol = symbol
+
+    @property
+    def lex(self):
+        return self.symbols.names[self.symbol]
+
+
+class EOFToken(SpanToken):
+    """
+    End of input token. It records the offset where the buffer ends; its
+    lexeme is always `$`.
+    """
+
+    lex = "$"
+
+
+class SymbolTable:
+    """
+    Interned lexemes of a compilation. Each distinct lexeme is stored once and
+    gets a small integer id, so later phases can compare or key by id.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def intern(self, lex):
+        """Id of `lex`, adding it to the table the first time it is seen."""
+        try:
+            return self.ids[lex]
+        except KeyError:
+            self.ids[lex] = symbol = len(self.names)
+            self.names.append(sys.intern(lex))
+            return symbol
+
+    def __getitem__(self, symbol):
+        return self.names[symbol]
+
+    def __contains__(self, lex):
+        return lex in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+
+class TokenBuffer:
+    """
+    Token sequence stored as parallel arrays (struct of arrays). Each token is
+    an integer type id plus its offsets; `Token` objects are only created, as
+    `SpanToken` views, when an item is read, and locations are resolved through
+    a shared `LineIndex`.
+
+    Parameters
+    ----------
+    source : str or bytes-like
+        Buffer the tokens were read from.
+    token_types : list
+        Token types indexed by type id.
+    eof : Enum
+        End of input token type.
+    symbol_table : SymbolTable, optional
+        Table where identifiers and keywords are interned; the `symbols`
+        column holds their ids (-1 for other tokens).
+    """
+
+    def __init__(self, source, token_types, eof, symbol_table=None):
+        self.source = source
+        self.token_types = token_types
+        self.eof = eof
+        self.lines = LineIndex(source)
+        self.symbol_table = symbol_table if symbol_table is not None else SymbolTable()
+        self.types = array("i")
+        self.starts = array("q")
+        self.ends = array("q")
+        self.symbols = array("i")
+
+    def append(self, type_id, start, end, symbol=-1):
+        self.types.append(type_id)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.symbols.append(symbol)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        token_type = self.token_types[self.types[index]]
+        start, end, symbol = self.starts[index], self.ends[index], self.symbols[index]
+        if symbol >= 0:
+            return SymbolToken(
+                self.source,
+                start,
+                end,
+                token_type,
+                self.lines,
+                self.symbol_table,
+                symbol,
+            )
+        cls = EOFToken if token_type is self.eof else SpanToken
+        return cls(self.source, start, end, token_type, self.lines)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, other):
+        if not isinstance(other, (TokenBuffer, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return str(self)
+
+
 class UnknownToken(Token):
     def __init__(self, lex):
         Token.__init__(self, lex, None)
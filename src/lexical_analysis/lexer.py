@@ -1,5 +1,15 @@
 import sys
 import os
+import re
+import mmap
+import math
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import importlib
+from bisect import bisect_left, bisect_right
+from copy import copy
+import tempfile
+from array import array
 
 current_dir = os.getcwd()
 sys.path.insert(0, current_dir)
@@ -8,24 +18,201 @@ from src.lexical_analysis.regular_expressions import Regex
 from src.cmp.automata import (
     State,
 )
-from src.cmp.utils import Token
+from src.cmp.utils import (
+    EOFToken,
+    LineIndex,
+    SpanToken,
+    SymbolTable,
+    SymbolToken,
+    Token,
+    TokenBuffer,
+    lexeme,
+)
+from src.tools.automatas import (
+    CharSet,
+    ClassMap,
+    alphabet_classes,
+    refine_partition,
+    split_symbols,
+)
+from src.tools.automata_format import PackedAutomaton, pack_tables
+
+# Versión del formato de la caché en disco; cambiarla invalida las cachés existentes.
+CACHE_VERSION = 7
+
+
+# Patrones que son una palabra literal, candidatos a palabra clave
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _escape(code):
+    """El carácter `code` dentro de una clase `[...]` de `re`; fuera de ASCII se escribe
+    como secuencia de escape para que el patrón sirva también sobre bytes."""
+    if code < 128:
+        return re.escape(chr(code))
+    return ("\\x%02x" if code < 256 else "\\U%08x") % code
 
 
 class Lexer:
-    def __init__(self, table, eof, includesapces=True):
+    def __init__(
+        self,
+        table,
+        eof,
+        includesapces=True,
+        cache=None,
+        keywords=False,
+        recover=False,
+    ):
+        self._setup(table, eof, includesapces, keywords, recover)
+
+        cached = self._load_cache(cache) if cache else None
+        if cached is None:
+            words, hosts = self._split_keywords()
+            self.words = hosts | {tag[0] for tag in words.values()}
+            self.keywords, self.hosts = (words, hosts) if keywords else ({}, set())
+            tables = self._compile_automaton()
+            if cache:
+                self._dump_cache(cache, tables)
+        else:
+            tables, self.keywords, self.hosts, self.words = cached
+        self.classes, self.width, self.transitions, self.accept = tables
+        self.word_ids = {self.type_ids[self.table[n][0]] for n in self.words}
+        self.skips = self._build_skips(str), self._build_skips(bytes)
+        starts = {cls for cls in range(self.width) if self.transitions[cls] >= 0}
+        others = set(range(self.width)) - starts
+        self.resyncs = self._scanner(str, others), self._scanner(bytes, others)
+
+    def _setup(self, table, eof, includesapces, keywords, recover):
+        """Atributos que no dependen de las tablas compiladas."""
         self.eof = eof
-        self.regexs = self._build_regexs(table)
-        self.automaton = self._build_automaton()
+        self.table = table
+        self._patterns = {}
+        self._regexs = None
+        self._automaton = None
+        self._lookahead = None
         self.spaces = includesapces
+        self.keyword_mode = keywords
+        self.recover = recover
+        self.ignored = {"newline", "comment"} | ({"space"} if includesapces else set())
+        self.token_types = list(dict.fromkeys([t for t, _ in table] + [eof, "error"]))
+        self.type_ids = {t: i for i, t in enumerate(self.token_types)}
+        # Etiqueta de los tokens de error, con prioridad por debajo de cualquier patrón
+        self.error = (len(table), "error")
+
+    @property
+    def regexs(self):
+        if self._regexs is None:
+            self._regexs = self._build_regexs(self.table)
+        return self._regexs
+
+    @property
+    def automaton(self):
+        if self._automaton is None:
+            self._automaton = self._build_automaton()
+        return self._automaton
+
+    @property
+    def cache_key(self):
+        """Hash de la tabla de patrones y del modo del lexer: identifica las tablas
+        compiladas en la caché."""
+        patterns = [(str(token_type), regex) for token_type, regex in self.table]
+        key = repr((patterns, self.keyword_mode))
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _load_cache(self, path):
+        """Carga las tablas compiladas de `path` si fueron generadas con la misma versión
+        de formato y la misma tabla de patrones; en otro caso devuelve None.
+
+        El fichero se proyecta en memoria (ver `PackedAutomaton.load`) y las
+        transiciones se leen sobre esa proyección sin copiarlas, así que los procesos
+        que cargan la misma caché comparten sus páginas."""
+        try:
+            packed = PackedAutomaton.load(path)
+            data = packed.meta
+            if data["version"] != CACHE_VERSION or data["key"] != self.cache_key:
+                return None
+        except Exception:
+            return None
+
+        accept = [None if n < 0 else (n, self.table[n][0]) for n in packed.tags]
+        keywords = {word: (n, self.table[n][0]) for word, n in data["keywords"].items()}
+        tables = (packed.classes(), packed.width, packed.transitions, accept)
+        return tables, keywords, set(data["hosts"]), set(data["words"])
+
+    def _dump_cache(self, path, tables):
+        """Guarda las tablas compiladas en `path` con el formato binario de
+        `src.tools.automata_format`. De la etiqueta de cada estado solo se guarda la
+        prioridad, el tipo de token se recupera de la tabla al cargar. La escritura es
+        atómica para que varios procesos puedan compartir la caché."""
+        data = {
+            "version": CACHE_VERSION,
+            "key": self.cache_key,
+            "keywords": {word: tag[0] for word, tag in self.keywords.items()},
+            "hosts": sorted(self.hosts),
+            "words": sorted(self.words),
+        }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pack_tables(*tables, meta=data))
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _pattern(self, n):
+        """Autómata mínimo del patrón `n` de la tabla, construido una sola vez."""
+        try:
+            return self._patterns[n]
+        except KeyError:
+            self._patterns[n] = automaton = Regex(self.table[n][1]).automaton
+            return automaton
+
+    def _split_keywords(self):
+        """Separa las palabras clave del autómata.
+
+        Un patrón es palabra clave si es una palabra literal que también reconoce otro
+        patrón no literal (su anfitrión, p. ej. `identifier`). Las palabras clave no se
+        compilan en el DFA: se reconoce el lexema con el anfitrión y después se busca en
+        la tabla de palabras clave, conservando la misma prioridad que tenían los
+        patrones. Devuelve esa tabla y las prioridades de los anfitriones.
+
+        Fuera del modo de palabras clave se calcula igual: los lexemas de las palabras
+        clave y de sus anfitriones se internan en la tabla de símbolos (ver `scan`)."""
+        words = [n for n, (_, regex) in enumerate(self.table) if WORD.fullmatch(regex)]
+        others = [n for n in range(len(self.table)) if n not in words]
+
+        keywords = {}
+        hosts = set()
+        for n in words:
+            token_type, word = self.table[n]
+            found = {m for m in others if self._pattern(m).recognize(word)}
+            if found:
+                keywords.setdefault(word, (n, token_type))
+                hosts |= found
+        return keywords, hosts
 
     def _build_regexs(self, table):
         """toma una tabla de tipos de tokens y sus correspondientes expresiones regulares,
         y construye un autómata para cada uno. Cada estado final en el autómata se etiqueta
-        con su índice y tipo de token correspondiente."""
+        con su índice y tipo de token correspondiente. Las palabras clave separadas por
+        `_split_keywords` se omiten. Los símbolos de todos los autómatas se parten en
+        un mismo alfabeto de intervalos disjuntos (ver `split_symbols`)."""
+        numbers = [
+            n for n, (_, regex) in enumerate(table) if regex not in self.keywords
+        ]
+        patterns = split_symbols([self._pattern(n) for n in numbers])
+
         regexs = []
-        for n, (token_type, regex) in enumerate(table):
+        for n, pattern in zip(numbers, patterns):
+            token_type = table[n][0]
             # Your code here!!!
-            automaton, states = State.from_nfa(Regex(regex).automaton, get_states=True)
+            automaton, states = State.from_nfa(pattern, get_states=True)
 
             for state in states:
                 if state.final:
@@ -45,60 +232,875 @@ class Lexer:
 
         return start.to_deterministic()
 
-    def _walk(self, string):
-        state = self.automaton
-        final = state if state.final else None
-        lex = ""
+    def _compile_automaton(self):
+        """Aplana el autómata determinístico en tablas de enteros.
 
-        for symbol in string:
-            # Your code here!!!
-            if state.has_transition(symbol):
-                lex += symbol
-                state = state[symbol][0]
+        Los estados se numeran en orden de descubrimiento (el inicial es el 0, ver
+        `CompiledAutomaton`), se minimizan y los
+        intervalos de caracteres se agrupan en clases de equivalencia (ver
+        `alphabet_classes` y `ClassMap`): la clase 0 es la de los caracteres fuera del
+        alfabeto. `transitions[state * width + cls]` es el estado destino o -1 si no hay
+        transición, y `accept[state]` guarda la etiqueta `(prioridad, tipo de token)`
+        ganadora del estado, o None si no es final.
+        """
+        compiled = self.automaton.compile(tag=self._tag)
+        width = compiled.width
+        transitions, accept = self._minimize(width, compiled.transitions, compiled.tags)
 
-                if state.final:
-                    final = state
-                    final.lex = lex
-            else:
+        columns = {
+            symbol: transitions[column::width]
+            for column, symbol in enumerate(compiled.symbols)
+        }
+        classes, signatures = alphabet_classes(columns)
+        classes = ClassMap(classes)
+
+        width = len(signatures) + 1
+        table = array("i", [-1]) * (len(accept) * width)
+        for cls, column in enumerate(signatures, 1):
+            for state, target in enumerate(column):
+                table[state * width + cls] = target
+
+        return classes, width, table, accept
+
+    @staticmethod
+    def _tag(state):
+        """Etiqueta ganadora de un estado del DFA: la de menor prioridad entre los
+        estados finales de los patrones que lo componen."""
+        tags = [s.tag for s in state.state if s.tag] if state.final else []
+        return min(tags) if tags else None
+
+    @staticmethod
+    def _minimize(width, transitions, accept):
+        """Minimiza las tablas con el algoritmo de Hopcroft.
+
+        La partición inicial agrupa los estados por su etiqueta ganadora, así dos
+        estados finales que reconocen tipos de token distintos nunca se fusionan."""
+        states = len(accept)
+
+        partition = {}
+        for state, tag in enumerate(accept):
+            partition.setdefault(tag, []).append(state)
+
+        inverse = {column: {} for column in range(width)}
+        for state in range(states):
+            for column in range(width):
+                target = transitions[state * width + column]
+                if target >= 0:
+                    inverse[column].setdefault(target, []).append(state)
+
+        block = refine_partition(partition.values(), inverse)
+
+        ## El grupo del estado inicial pasa a ser el estado 0
+        index = {}
+        for state in range(states):
+            index.setdefault(block[state], len(index))
+
+        minimized = array("i", [-1]) * (len(index) * width)
+        tags = [None] * len(index)
+        for state in range(states):
+            new = index[block[state]]
+            tags[new] = accept[state]
+            for column in range(width):
+                target = transitions[state * width + column]
+                if target >= 0:
+                    minimized[new * width + column] = index[block[target]]
+
+        return minimized, tags
+
+    def _scanner(self, kind, accepted):
+        """`match` de un patrón `re` precompilado (sobre str o bytes según `kind`) que
+        consume de una vez una racha de caracteres cuya clase está en `accepted`. En
+        bytes cada byte cuenta como el carácter de su mismo código (ver `ClassMap`)."""
+        charset = self.classes.charset(accepted)
+        if kind is bytes:
+            charset &= CharSet([(0, 255)])
+
+        pattern = "[%s]*" % "".join(
+            _escape(lo) if lo == hi else _escape(lo) + "-" + _escape(hi)
+            for lo, hi in charset.intervals
+        )
+        if not charset:
+            pattern = ""
+        if kind is bytes:
+            pattern = pattern.encode("latin-1")
+        return re.compile(pattern).match
+
+    def _build_skips(self, kind):
+        """Para cada estado con transiciones hacia sí mismo, un `_scanner` que consume de
+        una vez la racha de caracteres que no lo hacen cambiar de estado: espacios, el
+        cuerpo de un comentario o de una cadena. None para los demás estados."""
+        skips = []
+        width, transitions = self.width, self.transitions
+        for state in range(len(self.accept)):
+            loops = {
+                cls for cls in range(width) if transitions[state * width + cls] == state
+            }
+            skips.append(self._scanner(kind, loops) if loops else None)
+        return skips
+
+    def _walk(self, text, start):
+        """Avanza por las tablas desde `start` y devuelve la etiqueta ganadora y el
+        offset final del lexema más largo reconocido, o (None, start) si no hay ninguno.
+        El tercer valor es el estado en que terminó el recorrido: -1 si se detuvo por
+        falta de transición, o un estado vivo si se agotó `text`.
+
+        Al entrar en un estado con bucles se salta toda la racha de caracteres que lo
+        mantienen con un único `match` (ver `_build_skips`). Los caracteres no ASCII se
+        clasifican por bisección la primera vez que aparecen (ver `ClassMap`)."""
+        classes = self.classes
+        chars = classes.chars
+        transitions = self.transitions
+        accept = self.accept
+        width = self.width
+        skips = self.skips[0] if isinstance(text, str) else self.skips[1]
+
+        state = 0
+        final = None
+        end = start
+
+        i, length = start, len(text)
+        while i < length:
+            try:
+                state = transitions[state * width + chars[text[i]]]
+            except KeyError:
+                state = transitions[state * width + classes[text[i]]]
+            if state < 0:
                 break
+            i += 1
 
-        if final:
-            return final, final.lex
+            skip = skips[state]
+            if skip is not None:
+                i = skip(text, i).end()
 
-        return None, None
+            if accept[state] is not None:
+                final = accept[state]
+                end = i
 
-    def _tokenize(self, text):
-        # Your code here!!!
-        row = 1
-        col = 1
-        while text:
-            final, lex = self._walk(text)
+        return self._keyword(final, text, start, end), end, state
 
-            assert final, "Unexpected token nearby: " + text[:10]
+    def _keyword(self, final, text, start, end):
+        """Etiqueta del lexema `text[start:end]` reconocido con `final`: la de su palabra
+        clave si la tiene y `final` es de un anfitrión (ver `_split_keywords`)."""
+        if final and final[0] in self.hosts:
+            keyword = self.keywords.get(self._lexeme(text, start, end))
+            if keyword and keyword[0] < final[0]:
+                return keyword
+        return final
 
-            text = text[len(lex) :]
+    def _spans(self, text, read=None, pos=0):
+        """Recorre `text` con un único cursor desde `pos` y produce `(texto, inicio, fin,
+        etiqueta)` por cada token, incluidos los que luego se descartan, sin copiar la
+        entrada restante.
 
-            final = [state.tag for state in final.state if state.tag]
-            final.sort()
+        Si se da `read`, `text` es solo una ventana de la entrada: cuando un lexema podría
+        continuar más allá del final de la ventana se descarta lo ya consumido, se añade
+        `read()` y se vuelve a intentar. Los offsets son relativos a la ventana producida.
+        """
+        while True:
+            final, end, state = self._walk(text, pos)
 
-            if self.spaces and final[0][1] == "space":
-                col += len(lex)
-                continue
+            if read is not None and state >= 0:
+                chunk = read()
+                if chunk:
+                    text, pos = text[pos:] + chunk, 0
+                    continue
+                read = None
 
-            if final[0][1] == "newline":
-                row += 1
-                col = 1
-                continue
+            if pos == len(text):
+                return
+
+            if not final:
+                final, end = self.error, self._resync(text, pos)
+                ## El token de error puede seguir en el bloque siguiente
+                while read is not None and end == len(text):
+                    chunk = read()
+                    if not chunk:
+                        read = None
+                        break
+                    text, pos = text[pos:] + chunk, 0
+                    end = self._resync(text, pos)
+
+            yield text, pos, end, final
+            pos = end
+
+    def _resync(self, text, pos):
+        """Error léxico en `pos`. Sin `recover` detiene el análisis; con `recover`
+        devuelve dónde termina el token de error: el siguiente carácter con el que
+        puede empezar un token."""
+        assert self.recover, "Unexpected token nearby: " + self._lexeme(
+            text, pos, pos + 10
+        )
+        resync = self.resyncs[0] if isinstance(text, str) else self.resyncs[1]
+        return resync(text, pos + 1).end()
+
+    def errors(self, tokens):
+        """Tokens de error de `tokens` (ver `recover`), cada uno con su lexema y su
+        posición."""
+        if isinstance(tokens, TokenBuffer):
+            error = self.type_ids["error"]
+            return [tokens[i] for i, t in enumerate(tokens.types) if t == error]
+        return [token for token in tokens if token.token_type == "error"]
+
+    def _tokenize(self, spans, text, pos=0):
+        """Descarta espacios, saltos de línea y comentarios de `spans` (ver `_spans`),
+        que empiezan en `pos`, y produce `(texto, inicio, fin, tipo)` por cada token,
+        terminando con el fin de fichero. Las filas y columnas no se calculan aquí: se
+        resuelven a partir de los offsets con un `LineIndex`."""
+        ignored = self.ignored
+        for text, start, pos, final in spans:
+            if final[1] not in ignored:
+                yield text, start, pos, final[1]
+
+        yield text, pos, pos, self.eof
+
+    _lexeme = staticmethod(lexeme)
+
+    def scan(self, buffer, symbols=None):
+        """Tokeniza un buffer (str, bytes, memoryview o mmap) en tiempo lineal.
+
+        Devuelve un `TokenBuffer`: los tokens se guardan como arreglos de ids de tipo y
+        offsets sobre `buffer`, y el lexema solo se extrae cuando se lee `token.lex`.
+        Los identificadores y palabras clave se internan en `symbols`, la tabla de
+        símbolos de la compilación (una nueva si no se da)."""
+        tokens = self._tokenize(self._spans(buffer), buffer)
+        return self._buffer(buffer, tokens, symbols)
 
-            if final[0][1] == "comment":
-                col += len(lex)
+    def _buffer(self, buffer, tokens, symbols=None):
+        """Guarda los tokens de `_tokenize` en un `TokenBuffer` con el id de su tipo y,
+        si es un identificador o una palabra clave, el id de su lexema en `symbols`."""
+        result = TokenBuffer(buffer, self.token_types, self.eof, symbols)
+        self._extend(result, tokens)
+        return result
+
+    def _extend(self, result, tokens):
+        """Agrega a `result` los tokens de `_tokenize` (ver `_buffer`)."""
+        append, ids, words = result.append, self.type_ids, self.word_ids
+        intern, lexeme = result.symbol_table.intern, self._lexeme
+        for text, start, end, ttype in tokens:
+            type_id = ids[ttype]
+            if type_id in words:
+                append(type_id, start, end, intern(lexeme(text, start, end)))
+            else:
+                append(type_id, start, end)
+
+    def _token(self, buffer, start, end, ttype, lines, symbols=None):
+        if ttype is self.eof:
+            return EOFToken(buffer, start, end, ttype, lines)
+        if symbols is not None and self.type_ids[ttype] in self.word_ids:
+            symbol = symbols.intern(self._lexeme(buffer, start, end))
+            return SymbolToken(buffer, start, end, ttype, lines, symbols, symbol)
+        return SpanToken(buffer, start, end, ttype, lines)
+
+    @property
+    def lookahead(self):
+        """Máximo de caracteres que un recorrido puede examinar más allá del final del
+        lexema reconocido (infinito si no está acotado). Un token no cambia si una
+        edición empieza después de `token.end + lookahead`."""
+        if self._lookahead is None:
+            width, transitions, accept = self.width, self.transitions, self.accept
+            depth = {}
+
+            def visit(state):
+                if state in depth:
+                    return depth[state]
+                depth[state] = math.inf  # en curso: un ciclo no está acotado
+                steps = 0
+                for cls in range(width):
+                    target = transitions[state * width + cls]
+                    if target >= 0 and accept[target] is None:
+                        steps = max(steps, 1 + visit(target))
+                depth[state] = steps
+                return steps
+
+            # Solo cuentan los estados finales alcanzados tras consumir algún carácter
+            finals = {target for target in transitions if target >= 0}
+            finals = [state for state in finals if accept[state] is not None]
+            self._lookahead = max((visit(state) for state in finals), default=0)
+        return self._lookahead
+
+    def relex(self, previous_tokens, edit, symbols=None):
+        """Vuelve a tokenizar solo la zona afectada por `edit`.
+
+        `previous_tokens` es el resultado de `scan` sobre el texto anterior y `edit` la
+        tupla `(offset, eliminados, insertado)`. Se retoma desde el final del último
+        token que la edición no puede alterar (ver `lookahead`) y se avanza hasta que un
+        token nuevo empieza donde empezaba uno anterior, ya pasada la edición. Devuelve
+        un `TokenDiff` cuyo `apply` produce los tokens nuevos (ver `EditedTokens`). Los lexemas se
+        internan en `symbols` o, por defecto, en la tabla de `previous_tokens`."""
+        if symbols is None:
+            symbols = getattr(previous_tokens, "symbol_table", None)
+        offset, removed, inserted = edit
+        old = previous_tokens[-1].source
+        source = old[:offset] + inserted + old[offset + removed :]
+        delta = len(inserted) - removed
+
+        start, pos = 0, 0
+        if self.lookahead != math.inf:
+            start = bisect_left(
+                previous_tokens,
+                offset - self.lookahead,
+                hi=len(previous_tokens) - 1,
+                key=lambda token: token.end,
+            )
+            if self.recover:
+                start = self._first_error(previous_tokens, start)
+            if start:
+                pos = previous_tokens[start - 1].end
+
+        tokens = []
+        stop = len(previous_tokens)
+        lines = LineIndex(source)
+        spans = self._spans(source, pos=pos)
+        for _, begin, end, ttype in self._tokenize(spans, source, pos):
+            if begin >= offset + len(inserted) and ttype is not self.eof:
+                m = bisect_left(
+                    previous_tokens,
+                    begin - delta,
+                    lo=start,
+                    hi=len(previous_tokens) - 1,
+                    key=lambda token: token.start,
+                )
+                if previous_tokens[m].start == begin - delta:
+                    stop = m
+                    break
+            tokens.append(self._token(source, begin, end, ttype, lines, symbols))
+
+        return TokenDiff(source, start, stop, tokens, delta, lines)
+
+    def _first_error(self, tokens, stop):
+        """Índice del primer token de error de `tokens[:stop]`, o `stop` si no hay. El
+        recorrido que produjo un token de error no reconoció nada, así que `lookahead`
+        no acota hasta dónde leyó: pudo llegar a cualquier edición posterior."""
+        if isinstance(tokens, TokenBuffer):
+            try:
+                return tokens.types.index(self.type_ids["error"], 0, stop)
+            except ValueError:
+                return stop
+        for i in range(stop):
+            if tokens[i].token_type == "error":
+                return i
+        return stop
+
+    def _detached(self):
+        """Copia del lexer con solo las tablas y las prioridades de cada etiqueta, sin los
+        tipos de token ni los autómatas, para enviarla a otros procesos."""
+        lexer = Lexer.__new__(Lexer)
+        # Las transiciones de una caché proyectada en memoria no se pueden serializar
+        lexer.classes, lexer.width, lexer.transitions = (
+            self.classes,
+            self.width,
+            array("i", self.transitions),
+        )
+        lexer.accept = [None if tag is None else (tag[0], None) for tag in self.accept]
+        lexer.keywords = {word: (tag[0], None) for word, tag in self.keywords.items()}
+        lexer.hosts = self.hosts
+        lexer.skips = self.skips
+        return lexer
+
+    def scan_parallel(self, buffer, processes=None, chunk_size=1 << 20, symbols=None):
+        """Tokeniza `buffer` repartiendo bloques de unos `chunk_size` caracteres entre
+        un pool de procesos. El resultado es idéntico al de `scan`; `buffer` puede ser un
+        str, bytes o un mmap.
+
+        Los bloques se cortan después de un salto de línea. Cada proceso tokeniza su
+        bloque desde el principio y se detiene antes del último lexema, que podría
+        seguir en el bloque siguiente. Al unir, los tokens de un bloque solo se aceptan
+        a partir del primero que empieza donde llega la tokenización secuencial; si el
+        corte cayó dentro de una cadena o un comentario, el tramo hasta ese punto se
+        vuelve a tokenizar aquí."""
+        newline = "\n" if isinstance(buffer, str) else b"\n"
+        bounds = [0]
+        while bounds[-1] + chunk_size < len(buffer):
+            cut = buffer.find(newline, bounds[-1] + chunk_size)
+            if cut < 0:
+                break
+            bounds.append(cut + 1)
+        bounds.append(len(buffer))
+
+        if len(bounds) <= 2:
+            return self.scan(buffer, symbols)
+
+        chunks = [
+            (buffer[start:stop], start, stop == len(buffer))
+            for start, stop in zip(bounds, bounds[1:])
+        ]
+        ## Cada proceso entrega los tokens ya con el id de su tipo
+        kinds = [
+            -1 if token_type in self.ignored else self.type_ids[token_type]
+            for token_type, _ in self.table
+        ]
+        with ProcessPoolExecutor(
+            processes,
+            initializer=_init_worker,
+            initargs=(self._detached(), kinds, self.word_ids),
+        ) as pool:
+            results = list(pool.map(_scan_chunk, chunks))
+
+        return self._merge(buffer, results, symbols)
+
+    def _merge(self, buffer, results, symbols=None):
+        """Une los tokens de cada bloque en el orden de la tokenización secuencial.
+
+        Los tokens de un bloque, a partir del primero que empieza donde llega la
+        tokenización secuencial, se copian en bloque a los arreglos del resultado; solo
+        se tokeniza aquí lo que falta hasta ese token y el final de la entrada."""
+        result = TokenBuffer(buffer, self.token_types, self.eof, symbols)
+        intern, ignored = result.symbol_table.intern, self.ignored
+        pos = 0
+        for stop, spans, kept, chunk, names, firsts in results:
+            ## Avanzar secuencialmente hasta un inicio de token del bloque
+            tokens = []
+            while pos < stop:
+                index = bisect_left(spans, pos)
+                if index < len(spans) and spans[index] == pos:
+                    break
+                final, end, _ = self._walk(buffer, pos)
+                if not final:
+                    final, end = self.error, self._resync(buffer, pos)
+                if final[1] not in ignored:
+                    tokens.append((buffer, pos, end, final[1]))
+                pos = end
+            else:
+                self._extend(result, tokens)
                 continue
-            col += len(lex)
-            yield lex, final[0][1], row, col - len(lex)
+            self._extend(result, tokens)
+
+            ## Los lexemas se internan en el orden en que aparecen desde el token `k`,
+            ## como en la tokenización secuencial
+            k = kept[index]
+            types, starts, ends, symbol_ids = chunk
+            order = []
+            for symbol, first in enumerate(firsts):
+                if first < k:
+                    try:
+                        first = symbol_ids.index(symbol, k)
+                    except ValueError:
+                        continue
+                order.append((first, symbol))
+            mapping = [-1] * (len(names) + 1)
+            for _, symbol in sorted(order):
+                mapping[symbol] = intern(names[symbol])
+
+            result.types.extend(types[k:])
+            result.starts.extend(starts[k:])
+            result.ends.extend(ends[k:])
+            result.symbols.extend(map(mapping.__getitem__, symbol_ids[k:]))
+            pos = stop
+
+        spans = self._spans(buffer, pos=pos)
+        self._extend(result, self._tokenize(spans, buffer, pos))
+        return result
+
+    def scan_file(self, path):
+        """Tokeniza un fichero proyectándolo en memoria con mmap, sin leerlo a un str."""
+        with open(path, "rb") as file:
+            if not os.fstat(file.fileno()).st_size:
+                return self.scan(b"")
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.scan(buffer)
+
+    def stream(self, fileobj, chunk_size=1 << 16):
+        """Tokeniza `fileobj` leyendo bloques de `chunk_size` y produce cada token en
+        cuanto está completo.
+
+        Los lexemas que quedan cortados entre dos bloques (cadenas, comentarios,
+        operadores como `:=`) se completan con el bloque siguiente, de modo que la
+        memoria usada depende del tamaño del bloque y no del de la entrada. Como la
+        ventana se descarta, la fila y la columna se cuentan sobre cada lexema leído."""
+        read = lambda: fileobj.read(chunk_size)
+        text = read()
+        if isinstance(text, str):
+            newline, count = "\n", lambda text, start, end: end - start
+        else:
+            ## Las columnas cuentan caracteres, no bytes
+            newline = b"\n"
+            count = lambda text, start, end: len(self._lexeme(text, start, end))
+        row, col, pos = 1, 1, 0
+        for text, start, pos, final in self._spans(text, read):
+            if final[1] not in self.ignored:
+                yield Token(self._lexeme(text, start, pos), final[1], row, col)
+
+            lines = text.count(newline, start, pos)
+            if lines:
+                row += lines
+                col = count(text, text.rfind(newline, start, pos) + 1, pos) + 1
+            else:
+                col += count(text, start, pos)
+
+        yield Token("$", self.eof, row, col)
+
+    def __call__(self, text, symbols=None):
+        return self.scan(text, symbols)
+
+
+class GeneratedLexer(Lexer):
+    """
+    Lexer que recorre la entrada con el `walk` de un módulo generado por
+    `python -m src.lexical_analysis.lexgen`, sin construir expresiones regulares ni
+    autómatas. `module` es el módulo o su nombre y `table` la tabla de patrones con
+    que se generó, de la que se toman los tipos de token de cada prioridad.
+    """
+
+    def __init__(
+        self, module, table, eof, includesapces=True, keywords=True, recover=False
+    ):
+        if isinstance(module, str):
+            module = importlib.import_module(module)
+        self.module = module
+        self._setup(table, eof, includesapces, keywords, recover)
+
+        assert (
+            module.KEY == self.cache_key
+        ), "El módulo generado no corresponde a la tabla de patrones"
+        self._lookahead = module.LOOKAHEAD
+        self.words = set(getattr(module, "WORDS", ()))
+        self.word_ids = {self.type_ids[self.table[n][0]] for n in self.words}
+        self.resyncs = module.RESYNC, module.BYTE_RESYNC
+        self.tags = [(n, token_type) for n, (token_type, _) in enumerate(table)]
+
+    def _walk(self, text, start):
+        n, end, state = self.module.walk(text, start)
+        return (None if n is None else self.tags[n]), end, state
+
+    def _detached(self):
+        return _ModuleWalker(self.module.__name__)
+
+
+class _ModuleWalker:
+    """Recorrido de un módulo generado para los procesos de `Lexer.scan_parallel`: solo
+    viaja el nombre del módulo, que cada proceso importa."""
+
+    def __init__(self, name):
+        self.name = name
+        self.walk = None
+
+    def __getstate__(self):
+        return self.name
+
+    def __setstate__(self, name):
+        self.__init__(name)
+
+    def _walk(self, text, start):
+        if self.walk is None:
+            self.walk = importlib.import_module(self.name).walk
+        n, end, state = self.walk(text, start)
+        return (None if n is None else (n, None)), end, state
+
+
+class LazyLexer(Lexer):
+    """
+    Lexer que construye el DFA sobre la marcha: conserva los autómatas de los patrones
+    (`regexs`) y solo crea un estado del DFA, un conjunto de estados de esos autómatas,
+    la primera vez que la entrada llega a él. Las transiciones ya calculadas se
+    memorizan por clase de caracteres (ver `ClassMap`).
+
+    Los estados se guardan en una caché de a lo sumo `max_states` entradas; al llenarse
+    se vacía entera y se vuelve a poblar con los estados que la entrada siga visitando.
+    `stats` cuenta las transiciones memorizadas (`hits`), las calculadas (`misses`), los
+    estados vivos y los vaciados de la caché.
+
+    No hay tablas que recorrer, así que no se saltan rachas con `re` (ver
+    `_build_skips`) y `lookahead` no está acotado: `relex` retokeniza desde el inicio.
+    """
+
+    def __init__(
+        self,
+        table,
+        eof,
+        includesapces=True,
+        keywords=False,
+        recover=False,
+        max_states=256,
+    ):
+        self._setup(table, eof, includesapces, keywords, recover)
+        self.max_states = max_states
+        self._lookahead = math.inf
+
+        words, hosts = self._split_keywords()
+        self.words = hosts | {tag[0] for tag in words.values()}
+        self.keywords, self.hosts = (words, hosts) if keywords else ({}, set())
+        self.word_ids = {self.type_ids[self.table[n][0]] for n in self.words}
+
+        ## Los autómatas de los patrones comparten un alfabeto de átomos disjuntos: cada
+        ## átomo es una clase, y la 0 la de los caracteres fuera del alfabeto
+        self.atoms = [None] + sorted(
+            {
+                symbol
+                for start in self.regexs
+                for state in start
+                for symbol in state.transitions
+            }
+        )
+        self.classes = ClassMap(
+            {atom: cls for cls, atom in enumerate(self.atoms) if cls}
+        )
+        self.start = frozenset(State.epsilon_closure_by_state(*self.regexs))
+
+        self.states = {}
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+
+        starts = {
+            cls for cls in range(len(self.atoms)) if self._targets(self.start, cls)
+        }
+        others = set(range(len(self.atoms))) - starts
+        self.resyncs = self._scanner(str, others), self._scanner(bytes, others)
+
+    def __getstate__(self):
+        # Los autómatas no se serializan: cada proceso vuelve a construir el lexer
+        return (
+            self.table,
+            self.eof,
+            self.spaces,
+            self.keyword_mode,
+            self.recover,
+            self.max_states,
+        )
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def _targets(self, key, cls):
+        """Estados de los patrones a los que se llega desde `key` con la clase `cls`."""
+        atom = self.atoms[cls]
+        targets = set()
+        if atom is not None:
+            for state in key:
+                targets.update(state.transitions.get(atom, ()))
+        return State.epsilon_closure_by_state(*targets) if targets else targets
 
-        yield "$", self.eof, row, col
+    def _state(self, key):
+        """Estado del DFA para el conjunto `key`, creado si no está en la caché."""
+        try:
+            return self.states[key]
+        except KeyError:
+            pass
+        if len(self.states) >= self.max_states:
+            self.states.clear()
+            self.flushes += 1
+        tags = [s.tag for s in key if s.final and s.tag]
+        state = self.states[key] = _LazyState(
+            key, min(tags) if tags else None, len(self.atoms)
+        )
+        return state
 
-    def __call__(self, text):
-        return [
-            Token(lex, ttype, row, col) for lex, ttype, row, col in self._tokenize(text)
+    def _step(self, state, cls):
+        """Calcula y memoriza la transición de `state` con la clase `cls`: el estado
+        destino o None si no hay transición."""
+        self.misses += 1
+        targets = self._targets(state.key, cls)
+        target = state.moves[cls] = self._state(frozenset(targets)) if targets else None
+        return target
+
+    def _walk(self, text, start):
+        classes = self.classes
+        chars = classes.chars
+        unseen = _UNSEEN
+
+        state = self._state(self.start)
+        final = None
+        end = start
+        hits = 0
+
+        i, length = start, len(text)
+        while i < length:
+            try:
+                cls = chars[text[i]]
+            except KeyError:
+                cls = classes[text[i]]
+            target = state.moves[cls]
+            if target is unseen:
+                target = self._step(state, cls)
+            else:
+                hits += 1
+            if target is None:
+                break
+            state = target
+            i += 1
+
+            if state.tag is not None:
+                final = state.tag
+                end = i
+
+        self.hits += hits
+        live = 0 if i == length else -1
+        return self._keyword(final, text, start, end), end, live
+
+    def _detached(self):
+        return self
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "states": len(self.states),
+            "flushes": self.flushes,
+        }
+
+
+# Transición de un `_LazyState` que todavía no se ha calculado
+_UNSEEN = object()
+
+
+class _LazyState:
+    """Estado del DFA de `LazyLexer`: el conjunto `key` de estados de los patrones, su
+    etiqueta ganadora y el destino ya calculado por cada clase (`_UNSEEN` si no)."""
+
+    __slots__ = ("key", "tag", "moves")
+
+    def __init__(self, key, tag, width):
+        self.key = key
+        self.tag = tag
+        self.moves = [_UNSEEN] * width
+
+
+class TokenDiff:
+    """
+    Resultado de `Lexer.relex`: los tokens `previous_tokens[start:stop]` se reemplazan
+    por `tokens` y los siguientes se desplazan `delta` caracteres en `source`, cuyo
+    índice de líneas es `lines`.
+    """
+
+    def __init__(self, source, start, stop, tokens, delta, lines):
+        self.source = source
+        self.start = start
+        self.stop = stop
+        self.tokens = tokens
+        self.delta = delta
+        self.lines = lines
+
+    def apply(self, previous_tokens):
+        """Tokens del texto editado como `EditedTokens`, una vista sobre
+        `previous_tokens` que no los copia: aplicar la edición cuesta O(1) y la cola
+        solo se desplaza al leer cada token."""
+        return EditedTokens(self, previous_tokens)
+
+
+class EditedTokens:
+    """
+    Secuencia de tokens de un texto editado sin copiar los anteriores. Se guarda como
+    tramos `(tokens, inicio, fin, delta, source, lines)` de otras secuencias: los tokens
+    de un tramo con `source` se copian al leerlos, desplazados `delta` caracteres sobre
+    ese texto. Se puede pasar a `relex`: la edición siguiente corta y desplaza tramos, a
+    lo sumo dos más por edición, en lugar de anidar vistas. Recorrerla entera copia la
+    cola; `list(...)` la materializa una sola vez.
+    """
+
+    def __init__(self, diff, previous):
+        if isinstance(previous, EditedTokens):
+            segments = previous.segments
+        else:
+            segments = [(previous, 0, len(previous), 0, None, None)]
+
+        tail = [
+            (tokens, lo, hi, delta + diff.delta, diff.source, diff.lines)
+            for tokens, lo, hi, delta, _, _ in self._cut(
+                segments, diff.stop, len(previous)
+            )
         ]
+        self.segments = (
+            self._cut(segments, 0, diff.start)
+            + [(diff.tokens, 0, len(diff.tokens), 0, None, None)]
+            + tail
+        )
+        self.offsets = [0]
+        for _, lo, hi, _, _, _ in self.segments:
+            self.offsets.append(self.offsets[-1] + hi - lo)
+        self.symbol_table = getattr(previous, "symbol_table", None)
+
+    @staticmethod
+    def _cut(segments, start, stop):
+        """Tramos de los tokens `start:stop` de la secuencia formada por `segments`."""
+        result = []
+        pos = 0
+        for tokens, lo, hi, delta, source, lines in segments:
+            first, last = max(start - pos, 0), min(stop - pos, hi - lo)
+            if first < last:
+                result.append((tokens, lo + first, lo + last, delta, source, lines))
+            pos += hi - lo
+        return result
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+
+        n = bisect_right(self.offsets, index) - 1
+        tokens, lo, _, delta, source, lines = self.segments[n]
+        token = tokens[lo + index - self.offsets[n]]
+        if source is None:
+            return token
+        token = copy(token)
+        token.source, token.lines = source, lines
+        token.start += delta
+        token.end += delta
+        return token
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, other):
+        if not isinstance(other, (EditedTokens, TokenBuffer, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return str(self)
+
+
+# Lexer de cada proceso del pool de `Lexer.scan_parallel`, el id del tipo de token de
+# cada prioridad (-1 si se descarta) y los ids de los tipos cuyos lexemas se internan
+_worker = None
+
+
+def _init_worker(lexer, kinds, words):
+    global _worker
+    _worker = lexer, kinds, words
+
+
+def _scan_chunk(chunk):
+    """Tokeniza el bloque que empieza en el offset `base` de la entrada. Se detiene ante
+    un error o, salvo en el último bloque, en el lexema que llega al final del bloque.
+
+    Devuelve el offset hasta donde llegó, el inicio de cada lexema (también de los que
+    se descartan) y, para cada uno, cuántos tokens hay antes de él. Los tokens van en
+    arreglos de tipos, inicios, fines e ids de sus lexemas en una tabla de símbolos
+    propia del bloque, de la que se devuelven los nombres y el índice del primer token
+    de cada uno. Todos los offsets son de la entrada completa."""
+    text, base, last = chunk
+    lexer, kinds, words = _worker
+    spans, kept = array("q"), array("i")
+    types, starts, ends, symbol_ids = array("i"), array("q"), array("q"), array("i")
+    table, firsts = SymbolTable(), []
+    pos = 0
+    while pos < len(text):
+        final, end, state = lexer._walk(text, pos)
+        if not final or (state >= 0 and not last):
+            break
+        spans.append(base + pos)
+        kept.append(len(types))
+        type_id = kinds[final[0]]
+        if type_id >= 0:
+            symbol = -1
+            if type_id in words:
+                symbol = table.intern(lexeme(text, pos, end))
+                if symbol == len(firsts):
+                    firsts.append(len(types))
+            types.append(type_id)
+            starts.append(base + pos)
+            ends.append(base + end)
+            symbol_ids.append(symbol)
+        pos = end
+    chunk = types, starts, ends, symbol_ids
+    return base + pos, spans, kept, chunk, table.names, firsts
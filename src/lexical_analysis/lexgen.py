@@ -0,0 +1,199 @@
+"""Genera un módulo de Python con el lexer de HULK ya compilado.
+
+Uso:
+
+    python -m src.lexical_analysis.lexgen [-o hulk_lexer.py] [--no-keywords]
+
+El módulo generado solo depende de `re` y `bisect`: guarda las tablas minimizadas de
+`Lexer` como un diccionario de transiciones por estado (los caracteres que no están en
+él se clasifican por bisección en sus intervalos, ver `step`) y la prioridad aceptada
+por cada estado, y define `walk`, equivalente a `Lexer._walk` pero con prioridades en lugar de etiquetas.
+`GeneratedLexer` lo envuelve y traduce cada prioridad al tipo de token de la tabla,
+sin construir expresiones regulares ni autómatas.
+"""
+
+import sys
+import os
+import math
+import argparse
+
+current_dir = os.getcwd()
+sys.path.insert(0, current_dir)
+
+from src.lexical_analysis.lexer import Lexer
+from src.lexical_analysis.regex_patterns import build_regex
+from src.syntax_analysis.grammLR1 import EOF
+
+HEADER = '''"""Lexer generado por `python -m src.lexical_analysis.lexgen`. No editar.
+
+Cargarlo con `GeneratedLexer("{name}", tabla, eof)`, con la misma tabla de patrones
+con que se generó.
+"""
+
+import re
+from bisect import bisect_right
+
+
+def step(state, char):
+    """Destino desde `state` por un carácter que no está en su fila de TRANSITIONS: los
+    no ASCII se clasifican por bisección en STARTS/ENDS/CLASSES y se buscan en
+    WIDE[state], clase -> estado. El resultado se memoriza en la fila."""
+    code = char if isinstance(char, int) else ord(char)
+    i = bisect_right(STARTS, code) - 1
+    cls = CLASSES[i] if i >= 0 and code <= ENDS[i] else 0
+    target = TRANSITIONS[state][char] = WIDE[state].get(cls, -1)
+    return target
+'''
+
+WALK = '''
+
+def walk(text, start):
+    """Recorre `text` desde `start` y devuelve la prioridad del lexema más largo (o
+    None), su offset final y el estado en que terminó el recorrido (-1 si murió)."""
+    transitions = TRANSITIONS
+    accept = ACCEPT
+    skips = SKIPS if isinstance(text, str) else BYTE_SKIPS
+
+    state = 0
+    final = None
+    end = start
+
+    i, length = start, len(text)
+    while i < length:
+        try:
+            state = transitions[state][text[i]]
+        except KeyError:
+            state = step(state, text[i])
+        if state < 0:
+            break
+        i += 1
+
+        skip = skips[state]
+        if skip is not None:
+            i = skip(text, i).end()
+
+        if accept[state] is not None:
+            final = accept[state]
+            end = i
+
+    if final in HOSTS:
+        lex = text[start:end]
+        if not isinstance(lex, str):
+            lex = bytes(lex).decode("utf-8", errors="replace")
+        keyword = KEYWORDS.get(lex)
+        if keyword is not None and keyword < final:
+            final = keyword
+
+    return final, end, state
+'''
+
+
+def generate(lexer, name="hulk_lexer"):
+    """Código fuente del módulo generado a partir de las tablas de `lexer`."""
+    width, transitions, intervals = (
+        lexer.width,
+        lexer.transitions,
+        lexer.classes.intervals,
+    )
+
+    lines = [HEADER.format(name=name)]
+    lines.append(f"KEY = {lexer.cache_key!r}")
+    lookahead = lexer.lookahead
+    lines.append(
+        "LOOKAHEAD = %s" % ('float("inf")' if lookahead == math.inf else lookahead)
+    )
+    lines.append(
+        "KEYWORDS = %r" % {word: tag[0] for word, tag in sorted(lexer.keywords.items())}
+    )
+    lines.append(f"HOSTS = frozenset({sorted(lexer.hosts)!r})")
+    lines.append(f"WORDS = frozenset({sorted(lexer.words)!r})")
+    lines.append("")
+
+    ## Las clases se renumeran por su primer carácter y los estados en anchura
+    ## recorriendo las clases en ese orden, para que la salida no dependa del orden en
+    ## que se construyeron las tablas. La clase 0 no tiene transiciones.
+    classes = {0: 0}
+    for _, _, cls in intervals:
+        classes.setdefault(cls, len(classes))
+    target = lambda state, cls: transitions[state * width + cls]
+    order = [0]
+    number = {0: 0, -1: -1}
+    for state in order:
+        for cls in classes:
+            next_state = target(state, cls)
+            if next_state not in number:
+                number[next_state] = len(order)
+                order.append(next_state)
+
+    ## Los intervalos no ASCII se clasifican por bisección
+    wide = [(max(lo, 128), hi, cls) for lo, hi, cls in intervals if hi >= 128]
+    lines.append(f"STARTS = {tuple(lo for lo, _, _ in wide)!r}")
+    lines.append(f"ENDS = {tuple(hi for _, hi, _ in wide)!r}")
+    lines.append(f"CLASSES = {tuple(classes[cls] for _, _, cls in wide)!r}")
+    lines.append("")
+
+    ## Una tabla de despacho por estado: carácter ASCII -> estado siguiente, y clase de
+    ## los demás caracteres -> estado siguiente
+    ascii = [lexer.classes.classify(code) for code in range(128)]
+    wides = []
+    for new, state in enumerate(order):
+        row = {}
+        for code, cls in enumerate(ascii):
+            if target(state, cls) >= 0:
+                row[chr(code)] = number[target(state, cls)]
+        row.update({ord(char): next_state for char, next_state in list(row.items())})
+        others = {
+            classes[cls]: number[target(state, cls)]
+            for _, _, cls in wide
+            if target(state, cls) >= 0
+        }
+        lines.append(f"S{new} = {row!r}")
+        wides.append(others)
+    lines.append("")
+    lines.append(
+        "TRANSITIONS = (%s,)" % ", ".join(f"S{new}" for new in range(len(order)))
+    )
+    lines.append(f"WIDE = {tuple(wides)!r}")
+    accept = [lexer.accept[state] for state in order]
+    lines.append(
+        "ACCEPT = %r" % (tuple(None if tag is None else tag[0] for tag in accept),)
+    )
+
+    for variable, skips in zip(("SKIPS", "BYTE_SKIPS"), lexer.skips):
+        patterns = ", ".join(
+            (
+                "None"
+                if skips[state] is None
+                else f"re.compile({skips[state].__self__.pattern!r}).match"
+            )
+            for state in order
+        )
+        lines.append(f"{variable} = ({patterns},)")
+    for variable, resync in zip(("RESYNC", "BYTE_RESYNC"), lexer.resyncs):
+        lines.append(f"{variable} = re.compile({resync.__self__.pattern!r}).match")
+
+    return "\n".join(lines) + "\n" + WALK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="hulk-lexgen",
+        description="Genera un módulo de Python con el lexer de HULK compilado.",
+    )
+    parser.add_argument("-o", "--output", default="hulk_lexer.py")
+    parser.add_argument(
+        "--no-keywords",
+        action="store_true",
+        help="no separar las palabras clave del autómata (ver Lexer(keywords=...))",
+    )
+    args = parser.parse_args(argv)
+
+    lexer = Lexer(build_regex(), EOF, keywords=not args.no_keywords)
+    name = os.path.splitext(os.path.basename(args.output))[0]
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(generate(lexer, name))
+    print(f"{args.output}: {len(lexer.accept)} estados, {lexer.width} clases")
+
+
+if __name__ == "__main__":
+    main()
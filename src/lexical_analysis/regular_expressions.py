@@ -1,13 +1,21 @@
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+from dill import dump, load
+
 from src.cmp.ast import AtomicNode, BinaryNode, RangeNode, UnaryNode
 from src.cmp.pycompiler import Grammar
 from src.tools.automatas import (
     DFA,
     NFA,
+    CharSet,
     automata_closure,
     automata_concatenation,
     automata_minimization,
     automata_union,
-    nfa_to_dfa,
+    charset_partition,
+    merge_charsets,
 )
 
 from src.cmp.utils import Token
@@ -48,9 +56,21 @@ class ConcatNode(BinaryNode):
 
 
 class NegatedSetNode(UnaryNode):
+    # Secuencias de escape aceptadas: `\` seguido de uno de estos caracteres
+    ESCAPED = '"ntr'
+
+    # Caracteres que puede reconocer un conjunto negado: el ASCII imprimible y todo el
+    # resto de Unicode salvo los sustitutos (surrogates)
+    UNIVERSE = CharSet([(32, 126), (128, 0xD7FF), (0xE000, 0x10FFFF)])
+
+    @staticmethod
+    def allowed(vocabulary):
+        """CharSet de los caracteres que reconoce el conjunto negado de `vocabulary`
+        (un CharSet) por sí solos."""
+        return NegatedSetNode.UNIVERSE - CharSet.of('\\"') - vocabulary
+
     @staticmethod
     def operate(value):
-        all_chars = get_all_character()
         states = 3
         finals = {1}
         transitions = {}
@@ -61,10 +81,11 @@ class NegatedSetNode(UnaryNode):
         transitions[(2, "t")] = [3]
         transitions[(2, "r")] = [3]
 
-        for char in all_chars:
-            if char == "\\" or char == '"':
-                continue
-            if char not in value.vocabulary:
+        # Los autómatas de combinadores tienen un símbolo por carácter: solo se
+        # enumeran los de `get_all_character()`
+        allowed = NegatedSetNode.allowed(CharSet.of(value.vocabulary))
+        for char in get_all_character():
+            if char in allowed:
                 transitions[(0, char)] = [1]
 
         return NFA(
@@ -171,6 +192,190 @@ G = build_grammar()
 L = metodo_predictivo_no_recursivo(G)
 
 
+def vocabulary(node):
+    """CharSet de los caracteres que aparecen en la expresión `node`. Un rango es un
+    solo intervalo, sin enumerar sus caracteres."""
+    if isinstance(node, SymbolNode):
+        return CharSet.of(node.lex)
+    if isinstance(node, RangeNode):
+        return CharSet([(ord(node.left.lex), ord(node.right.lex))])
+    if isinstance(node, NegatedSetNode):
+        allowed = NegatedSetNode.allowed(vocabulary(node.node))
+        return allowed | CharSet.of("\\" + NegatedSetNode.ESCAPED)
+    if isinstance(node, UnaryNode):
+        return vocabulary(node.node)
+    if isinstance(node, BinaryNode):
+        return vocabulary(node.left) | vocabulary(node.right)
+    return CharSet()
+
+
+def followpos_automaton(tree):
+    """Construye el DFA de la expresión `tree` directamente desde el AST, sin autómatas
+    intermedios: cada hoja es una posición con su conjunto de caracteres, se calculan
+    nullable/firstpos/lastpos/followpos y los estados del DFA son conjuntos de
+    posiciones. Un subárbol compartido (`a+` es `a a*`) recibe posiciones distintas en
+    cada aparición.
+
+    Los conjuntos de las posiciones se parten en átomos disjuntos (ver
+    `charset_partition`) y los símbolos del DFA son esos átomos, así un rango o un
+    conjunto negado cuesta una transición por átomo y no una por carácter."""
+    chars = []  # CharSet de cada posición
+    follow = []  # posiciones que pueden seguir a cada posición
+
+    def leaf(symbols):
+        chars.append(symbols)
+        follow.append(set())
+        position = len(chars) - 1
+        return False, {position}, {position}
+
+    def concat(left, right):
+        lnullable, lfirst, llast = left
+        rnullable, rfirst, rlast = right
+        for position in llast:
+            follow[position] |= rfirst
+        first = lfirst | rfirst if lnullable else lfirst
+        last = llast | rlast if rnullable else rlast
+        return lnullable and rnullable, first, last
+
+    def union(left, right):
+        return left[0] or right[0], left[1] | right[1], left[2] | right[2]
+
+    def visit(node):
+        if isinstance(node, EpsilonNode):
+            return True, set(), set()
+        if isinstance(node, (SymbolNode, RangeNode)):
+            return leaf(vocabulary(node))
+        if isinstance(node, NegatedSetNode):
+            allowed = NegatedSetNode.allowed(vocabulary(node.node))
+            escape = concat(
+                leaf(CharSet.of("\\")), leaf(CharSet.of(NegatedSetNode.ESCAPED))
+            )
+            return union(leaf(allowed), escape)
+        if isinstance(node, ClosureNode):
+            _, first, last = visit(node.node)
+            for position in last:
+                follow[position] |= first
+            return True, first, last
+        if isinstance(node, ConcatNode):
+            return concat(visit(node.left), visit(node.right))
+        if isinstance(node, UnionNode):
+            return union(visit(node.left), visit(node.right))
+        raise TypeError(f"Invalid regex node: {node}")
+
+    ## Posición final aumentada: sin caracteres, marca los estados de aceptación
+    _, first, _ = concat(visit(tree), leaf(CharSet()))
+    end = len(chars) - 1
+    atoms = charset_partition(chars)
+
+    start = frozenset(first)
+    index = {start: 0}
+    states = [start]
+    transitions = {}
+    for state in states:
+        moves = {}
+        for position in state:
+            for atom in atoms[chars[position]]:
+                moves.setdefault(atom, set()).update(follow[position])
+        for atom, target in moves.items():
+            target = frozenset(target)
+            try:
+                transitions[index[state], atom] = index[target]
+            except KeyError:
+                transitions[index[state], atom] = index[target] = len(states)
+                states.append(target)
+
+    finals = [i for i, state in enumerate(states) if end in state]
+    return DFA(len(states), finals, transitions)
+
+
+class RegexCache:
+    """LRU de autómatas ya compilados, indexado por `(regex, skip_whitespaces)`, con
+    hasta `maxsize` entradas en memoria. Si se da `path`, cada autómata también se
+    guarda en ese directorio y lo pueden reutilizar otros procesos.
+
+    Los autómatas devueltos se comparten entre todos los que piden la misma expresión,
+    así que no deben modificarse."""
+
+    # Versión del formato en disco; cambiarla invalida los autómatas guardados.
+    VERSION = 2
+
+    def __init__(self, maxsize=512, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """Autómata de `key`, construido con `build()` solo si no está en la caché."""
+        try:
+            automaton = self.entries[key]
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return automaton
+        except KeyError:
+            pass
+
+        automaton = self._load(key) if self.path else None
+        if automaton is None:
+            self.misses += 1
+            automaton = build()
+            if self.path:
+                self._dump(key, automaton)
+        else:
+            self.disk_hits += 1
+
+        self.entries[key] = automaton
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return automaton
+
+    def _file(self, key):
+        digest = hashlib.sha256(repr((self.VERSION, key)).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, digest + ".joblib")
+
+    def _load(self, key):
+        try:
+            with open(self._file(key), "rb") as f:
+                stored_key, automaton = load(f)
+        except Exception:
+            return None
+        return automaton if stored_key == key else None
+
+    def _dump(self, key, automaton):
+        """Escritura atómica, para que varios procesos puedan compartir el directorio."""
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                dump((key, automaton), f)
+            os.replace(tmp, self._file(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+
+# Caché de `Regex.build_automaton`; HULK_REGEX_CACHE activa el almacén en disco
+cache = RegexCache(path=os.environ.get("HULK_REGEX_CACHE"))
+
+
 class Regex:
     def __init__(self, regex, skip_whitespaces=False):
         W = self
@@ -183,10 +388,21 @@ class Regex:
 
     @staticmethod
     def build_automaton(regex, skip_whitespaces=False):
+        return cache.get(
+            (regex, skip_whitespaces),
+            lambda: Regex.compile(regex, skip_whitespaces),
+        )
+
+    @staticmethod
+    def parse(regex, skip_whitespaces=False):
+        """AST de la expresión regular."""
         h = regex_tokenizer(regex, G, skip_whitespaces)
         f = L(h)
-        T = evaluate_parse(f, h)
-        H = T.evaluate()
-        X = nfa_to_dfa(H)
+        return evaluate_parse(f, h)
+
+    @staticmethod
+    def compile(regex, skip_whitespaces=False):
+        T = Regex.parse(regex, skip_whitespaces)
+        X = followpos_automaton(T)
         k = automata_minimization(X)
-        return k
+        return merge_charsets(k)
@@ -7,7 +7,7 @@ from src.cmp.pycompiler import (
     Terminal,
 )
 from src.cmp.pycompiler import Item
-from src.cmp.utils import ContainerSet
+from src.cmp.utils import ContainerSet, Token, TokenBuffer
 from src.tools.parsing import compute_local_first, compute_firsts
 from src.cmp.automata import multiline_formatter, State
 import sys
@@ -44,6 +44,20 @@ class ShiftReduceParser:
         raise NotImplementedError()
 
     def __call__(self, w):
+        # Se trabaja con ids enteros de tipo de token; un TokenBuffer ya los trae. Si no,
+        # `w` son tokens o directamente sus tipos
+        if isinstance(w, TokenBuffer):
+            token_types, types = w.token_types, w.types
+        else:
+            symbols = [
+                token.token_type if isinstance(token, Token) else token for token in w
+            ]
+            name = lambda symbol: getattr(symbol, "Name", symbol)
+            token_types = list({name(symbol): symbol for symbol in symbols}.values())
+            ids = {name(symbol): i for i, symbol in enumerate(token_types)}
+            types = [ids[name(symbol)] for symbol in symbols]
+        table = self.actionIndex(token_types)
+
         stack = [0]
         cursor = 0
         output = []
@@ -51,13 +65,13 @@ class ShiftReduceParser:
 
         while True:
             state = stack[-1]
-            lookahead = w[cursor]
+            lookahead = token_types[types[cursor]]
             if self.verbose:
-                print(stack, w[cursor:])
+                print(stack, [token_types[i] for i in types[cursor:]])
 
             # Detect error
             try:
-                action, tag = self.findActionAndTag(state, lookahead)
+                action, tag = table[state, types[cursor]]
                 # Shift case
                 if action == ShiftReduceParser.SHIFT:
                     operations.append(ShiftReduceParser.SHIFT)
@@ -89,10 +103,19 @@ class ShiftReduceParser:
                     f"Aborting parsing, item is not viable. lookahead: {lookahead}"
                 )
 
-    def findActionAndTag(self, state, lookahead):
-        for key, value in self.action.items():
-            if state == key[0] and lookahead.Name == key[1].Name:
-                return value
+    def actionIndex(self, token_types):
+        """Tabla ACTION indexada por `(estado, id de tipo)`, donde el id es la posición
+        del terminal en `token_types`. Los terminales se comparan por nombre, ya que
+        la tabla cargada de disco tiene sus propias instancias. Los tipos que no son
+        terminales de la gramática (espacios, comentarios) se ignoran."""
+        ids = {
+            getattr(symbol, "Name", symbol): i for i, symbol in enumerate(token_types)
+        }
+        return {
+            (state, ids[symbol.Name]): value
+            for (state, symbol), value in self.action.items()
+            if symbol.Name in ids
+        }
 
     def __iter__(self):
         # El iterador es el objeto mismo en este caso.
@@ -111,47 +134,46 @@ class ShiftReduceParser:
 
 class LR1Parser(ShiftReduceParser):
     def _build_parsing_table(self):
-        G = self.G.AugmentedGrammar(True)
+        G = self.G.AugmentedGrammar(True).Freeze()
 
-        automaton = build_LR1_automaton(G)
-        for i, node in enumerate(automaton):
-            if self.verbose:
-                print(i, "\t", "\n\t ".join(str(x) for x in node.state), "\n")
-            node.idx = i
-
-        for node in automaton:
-            idx = node.idx
-            for item in node.state:
-                # - Fill `self.Action` and `self.Goto` according to `item`)
-                # - Feel free to use `self._register(...)`)
-                if item.IsReduceItem:
-                    prod = item.production
-                    if prod.Left == G.startSymbol:
+        item_sets, gotos = build_LR1_item_sets(G)
+        if self.verbose:
+            for idx, items in enumerate(item_sets):
+                print(
+                    idx, "\t", "\n\t ".join(str(x) for x in lr1_items(G, items)), "\n"
+                )
+
+        start = G.SymbolIds[G.startSymbol]
+        for idx, items in enumerate(item_sets):
+            for (production, pos), lookaheads in items.items():
+                right = G.RightIds[production]
+                if pos == len(right):
+                    if G.LeftIds[production] == start:
                         LR1Parser._register(
                             self.action, (idx, G.EOF), (ShiftReduceParser.OK, None)
                         )
                     else:
-                        for lookahead in item.lookaheads:
+                        prod = G.Productions[production]
+                        for lookahead in lookaheads:
                             LR1Parser._register(
                                 self.action,
-                                (idx, lookahead),
+                                (idx, G.Symbols[lookahead]),
                                 (ShiftReduceParser.REDUCE, prod),
                             )
                 else:
-                    next_symbol = item.NextSymbol
-                    if next_symbol.IsTerminal:
+                    next_symbol = right[pos]
+                    if next_symbol < G.TerminalCount:
                         LR1Parser._register(
                             self.action,
-                            (idx, next_symbol),
-                            (ShiftReduceParser.SHIFT, node[next_symbol.Name][0].idx),
+                            (idx, G.Symbols[next_symbol]),
+                            (ShiftReduceParser.SHIFT, gotos[idx][next_symbol]),
                         )
                     else:
                         LR1Parser._register(
                             self.goto,
-                            (idx, next_symbol),
-                            node[next_symbol.Name][0].idx,
+                            (idx, G.Symbols[next_symbol]),
+                            gotos[idx][next_symbol],
                         )
-                pass
 
     @staticmethod
     def _register(table, key, value):
@@ -216,42 +238,106 @@ def goto_lr1(items, symbol, firsts=None, just_kernel=False):
     return items if just_kernel else closure_lr1(items, firsts)
 
 
-def build_LR1_automaton(G):
+def build_LR1_item_sets(G):
+    """
+    Colección canónica de conjuntos de items LR(1) de la gramática aumentada `G`,
+    calculada sobre los ids de `G.Freeze()`. Cada conjunto es un diccionario
+    `(id de producción, posición) -> frozenset de ids de lookaheads`; `gotos[i]` es el
+    diccionario `id de símbolo -> conjunto destino`. Los conjuntos se numeran en
+    anchura desde el inicial (el 0), recorriendo los símbolos por id.
+    """
     assert len(G.startSymbol.productions) == 1, "Grammar must be augmented"
+    G.Freeze()
+    rights, productions = G.RightIds, G.NonTerminalProductions
+    terminals = G.TerminalCount
 
     firsts = compute_firsts(G)
     firsts[G.EOF] = ContainerSet(G.EOF)
+    ids = G.SymbolIds
+    first_ids = [frozenset(ids[x] for x in firsts[symbol]) for symbol in G.Symbols]
+    nullable = [firsts[symbol].contains_epsilon for symbol in G.Symbols]
 
-    start_production = G.startSymbol.productions[0]
-    start_item = Item(start_production, 0, lookaheads=(G.EOF,))
-    start = frozenset([start_item])
+    suffixes = {}
 
-    closure = closure_lr1(start, firsts)
-    automaton = State(frozenset(closure), True)
+    def first_of_suffix(production, pos):
+        # First de rights[production][pos:] y si deriva en epsilon
+        try:
+            return suffixes[production, pos]
+        except KeyError:
+            pass
+        first = set()
+        for symbol in rights[production][pos:]:
+            first |= first_ids[symbol]
+            if not nullable[symbol]:
+                suffixes[production, pos] = result = (frozenset(first), False)
+                return result
+        suffixes[production, pos] = result = (frozenset(first), True)
+        return result
+
+    def closure(kernel):
+        items = {core: set(lookaheads) for core, lookaheads in kernel.items()}
+        pending = list(items)
+        while pending:
+            production, pos = core = pending.pop()
+            right = rights[production]
+            if pos == len(right) or right[pos] < terminals:
+                continue
+            lookaheads, propagates = first_of_suffix(production, pos + 1)
+            if propagates:
+                lookaheads = lookaheads | items[core]
+            for child in productions[right[pos]]:
+                current = items.get((child, 0))
+                if current is None:
+                    items[child, 0] = set(lookaheads)
+                    pending.append((child, 0))
+                elif not lookaheads <= current:
+                    current |= lookaheads
+                    pending.append((child, 0))
+        return {core: frozenset(lookaheads) for core, lookaheads in items.items()}
+
+    start_production = G.ProductionIds[G.startSymbol.productions[0]]
+    start = {(start_production, 0): frozenset([ids[G.EOF]])}
+    item_sets = [closure(start)]
+    gotos = []
+    index = {frozenset(start.items()): 0}
+
+    for items in item_sets:
+        kernels = {}
+        for (production, pos), lookaheads in items.items():
+            right = rights[production]
+            if pos < len(right):
+                kernels.setdefault(right[pos], {})[production, pos + 1] = lookaheads
+
+        transitions = {}
+        for symbol in sorted(kernels):
+            kernel = kernels[symbol]
+            key = frozenset(kernel.items())
+            try:
+                transitions[symbol] = index[key]
+            except KeyError:
+                transitions[symbol] = index[key] = len(item_sets)
+                item_sets.append(closure(kernel))
+        gotos.append(transitions)
 
-    pending = [start]
-    visited = {start: automaton}
+    return item_sets, gotos
 
-    while pending:
-        current = pending.pop()
-        current_state = visited[current]
 
-        for symbol in G.terminals + G.nonTerminals:
-            # (Get/Build `next_state`)
-            kernels = goto_lr1(current_state.state, symbol, just_kernel=True)
+def lr1_items(G, items):
+    """Items LR(1) (`Item`) de un conjunto de `build_LR1_item_sets`."""
+    return frozenset(
+        Item(G.Productions[production], pos, [G.Symbols[x] for x in lookaheads])
+        for (production, pos), lookaheads in items.items()
+    )
 
-            if not kernels:
-                continue
 
-            try:
-                next_state = visited[kernels]
-            except KeyError:
-                pending.append(kernels)
-                visited[pending[-1]] = next_state = State(
-                    frozenset(goto_lr1(current_state.state, symbol, firsts)), True
-                )
+def build_LR1_automaton(G):
+    item_sets, gotos = build_LR1_item_sets(G)
 
-            current_state.add_transition(symbol.Name, next_state)
+    states = [State(lr1_items(G, items), True) for items in item_sets]
+    for state, transitions in zip(states, gotos):
+        for symbol, target in transitions.items():
+            state.add_transition(G.Symbols[symbol].Name, states[target])
 
+    automaton = states[0]
     automaton.set_formatter(multiline_formatter)
     return automaton
@@ -0,0 +1,350 @@
+"""Formato binario versionado para autómatas de caracteres.
+
+Sirve para `NFA` y `DFA` (de `src.tools.automatas`), para `State` y
+`CompiledAutomaton` (de `src.cmp.automata`) y para las tablas de `Lexer`. Todos los
+enteros son de 32 bits con signo y little-endian, y cada sección empieza en un múltiplo
+de 4 bytes, así que los arreglos se leen con `memoryview.cast("i")` directamente sobre
+un `mmap` (o se copian con `array.frombytes`) sin crear un objeto por estado.
+
+Cabecera (32 bytes):
+
+    magic      4 bytes   b"HKAT"
+    version    uint16    VERSION
+    flags      uint16    bit 0: NFA (transiciones en formato CSR)
+    states     int32     cantidad de estados
+    width      int32     columnas por estado: la 0 y una por clase de caracteres
+    start      int32     estado inicial
+    intervals  int32     cantidad de intervalos del alfabeto
+    targets    int32     cantidad de destinos (solo NFA)
+    meta       int32     longitud de los metadatos
+
+Secciones, en este orden:
+
+    meta         JSON en UTF-8 con datos del usuario del formato
+    intervals    intervals x (inicio, fin, columna): códigos incluidos en cada clase
+    final        states bytes, 1 si el estado es final
+    tags         states enteros: etiqueta del estado o -1
+    DFA:
+    transitions  states * width enteros: destino de `state * width + column` o -1
+    NFA:
+    offsets      states * width + 1 enteros: los destinos de `state * width + column`
+                 son `targets[offsets[k]:offsets[k + 1]]`
+    targets      targets enteros
+
+La columna 0 es la de los caracteres fuera de todo intervalo, que no tienen
+transiciones; en un NFA guarda las transiciones ε.
+"""
+
+import sys
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+
+from src.tools.automatas import DFA, NFA, CharSet, ClassMap
+
+MAGIC = b"HKAT"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHiiiiii")
+NONDETERMINISTIC = 1
+
+
+def _padding(size):
+    return b"\0" * (-size % 4)
+
+
+def _ints(values):
+    values = array("i", values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _tag(tag):
+    if tag is None:
+        return -1
+    if isinstance(tag, tuple):
+        tag = tag[0]
+    if not isinstance(tag, int) or tag < 0:
+        raise ValueError(f"Only integer tags can be stored: {tag!r}")
+    return tag
+
+
+def _intervals(symbols):
+    """Intervalos `(inicio, fin, columna)` de los símbolos (caracteres o CharSet), con
+    la columna `n + 1` para `symbols[n]`. Los símbolos deben ser disjuntos."""
+    intervals = []
+    for column, symbol in enumerate(symbols, 1):
+        if isinstance(symbol, CharSet):
+            charset = symbol
+        elif isinstance(symbol, str) and len(symbol) == 1:
+            charset = CharSet.of(symbol)
+        else:
+            raise ValueError(f"Only character symbols can be stored: {symbol!r}")
+        intervals.extend((lo, hi, column) for lo, hi in charset.intervals)
+    intervals.sort()
+    for (_, hi, _), (lo, _, _) in zip(intervals, intervals[1:]):
+        if lo <= hi:
+            raise ValueError("The symbols of the automaton overlap")
+    return intervals
+
+
+def _pack(
+    states, width, start, intervals, final, tags, transitions, offsets=None, meta=None
+):
+    meta = json.dumps(meta if meta is not None else {}).encode("utf-8")
+    targets = transitions if offsets is not None else ()
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        NONDETERMINISTIC if offsets is not None else 0,
+        states,
+        width,
+        start,
+        len(intervals),
+        len(targets),
+        len(meta),
+    )
+    final = bytes(bytearray(1 if f else 0 for f in final))
+    sections = [
+        header,
+        meta + _padding(len(meta)),
+        _ints(value for interval in intervals for value in interval),
+        final + _padding(len(final)),
+        _ints(_tag(tag) for tag in tags),
+    ]
+    if offsets is not None:
+        sections.append(_ints(offsets))
+    sections.append(_ints(transitions))
+    return b"".join(sections)
+
+
+def pack(automaton, meta=None):
+    """Serializa `automaton` (NFA, DFA, State determinístico o CompiledAutomaton).
+    `meta` es un objeto JSON que se guarda junto al autómata."""
+    from src.cmp.automata import CompiledAutomaton, State
+
+    if isinstance(automaton, State):
+        automaton = automaton.compile()
+
+    if isinstance(automaton, CompiledAutomaton):
+        width = automaton.width + 1
+        transitions = array("i", [-1]) * (len(automaton) * width)
+        for state in range(len(automaton)):
+            row = automaton.transitions[
+                state * automaton.width : (state + 1) * automaton.width
+            ]
+            transitions[state * width + 1 : (state + 1) * width] = array("i", row)
+        return _pack(
+            len(automaton),
+            width,
+            0,
+            _intervals(automaton.symbols),
+            automaton.final,
+            automaton.tags,
+            transitions,
+            meta=meta,
+        )
+
+    symbols = sorted(automaton.vocabulary, key=lambda s: _intervals([s]))
+    columns = {symbol: column for column, symbol in enumerate(symbols, 1)}
+    columns[""] = 0
+    width = len(symbols) + 1
+    final = [state in automaton.finals for state in range(automaton.states)]
+    tags = [None] * automaton.states
+
+    if isinstance(automaton, DFA):
+        transitions = array("i", [-1]) * (automaton.states * width)
+        for (origin, symbol), (target,) in automaton.map.items():
+            transitions[origin * width + columns[symbol]] = target
+        return _pack(
+            automaton.states,
+            width,
+            automaton.start,
+            _intervals(symbols),
+            final,
+            tags,
+            transitions,
+            meta=meta,
+        )
+
+    offsets = [0]
+    targets = []
+    for state in range(automaton.states):
+        row = automaton.transitions[state]
+        for symbol in [""] + symbols:
+            targets.extend(sorted(row.get(symbol, ())))
+            offsets.append(len(targets))
+    return _pack(
+        automaton.states,
+        width,
+        automaton.start,
+        _intervals(symbols),
+        final,
+        tags,
+        targets,
+        offsets,
+        meta,
+    )
+
+
+def pack_tables(classes, width, transitions, accept, meta=None):
+    """Serializa las tablas de un `Lexer`: su `ClassMap`, el ancho, las transiciones
+    y la etiqueta `(prioridad, tipo)` de cada estado, de la que se guarda la prioridad.
+    """
+    states = len(accept)
+    return _pack(
+        states,
+        width,
+        0,
+        classes.intervals,
+        [tag is not None for tag in accept],
+        accept,
+        transitions,
+        meta=meta,
+    )
+
+
+class PackedAutomaton:
+    """
+    Autómata leído del formato binario. Los arreglos (`intervals`, `final`, `tags`,
+    `transitions` o `offsets`/`targets`) son vistas sobre el buffer original, salvo
+    que se pida `copy` o la máquina no sea little-endian: en ese caso son `array`.
+    """
+
+    def __init__(self, buffer, copy=False):
+        (
+            magic,
+            version,
+            flags,
+            self.states,
+            self.width,
+            self.start,
+            intervals,
+            targets,
+            meta,
+        ) = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an automaton file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported automaton format version {version}")
+        self.deterministic = not flags & NONDETERMINISTIC
+
+        view = memoryview(buffer)
+        copy = copy or sys.byteorder != "little"
+        offset = HEADER.size
+
+        def section(size, ints=True):
+            nonlocal offset
+            data = view[offset : offset + (4 * size if ints else size)]
+            offset += len(data) + (-len(data) % 4)
+            if not ints:
+                return bytes(data) if copy else data
+            if not copy:
+                return data.cast("i")
+            values = array("i")
+            values.frombytes(data)
+            if sys.byteorder != "little":
+                values.byteswap()
+            return values
+
+        self.meta = json.loads(bytes(section(meta, ints=False)).decode("utf-8"))
+        self.intervals = section(3 * intervals)
+        self.final = section(self.states, ints=False)
+        self.tags = section(self.states)
+        if self.deterministic:
+            self.offsets = None
+            self.transitions = section(self.states * self.width)
+        else:
+            self.offsets = section(self.states * self.width + 1)
+            self.transitions = section(targets)
+
+    @staticmethod
+    def load(path, copy=False):
+        """Lee el autómata de `path` proyectando el fichero en memoria con mmap: varios
+        procesos que lo carguen comparten las mismas páginas."""
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return PackedAutomaton(buffer, copy)
+
+    def charsets(self):
+        """Diccionario columna -> CharSet de sus caracteres."""
+        parts = {}
+        intervals = self.intervals
+        for k in range(0, len(intervals), 3):
+            column = intervals[k + 2]
+            parts.setdefault(column, []).append((intervals[k], intervals[k + 1]))
+        return {column: CharSet(charset) for column, charset in parts.items()}
+
+    def classes(self):
+        """`ClassMap` del alfabeto: cada columna es una clase."""
+        return ClassMap(
+            {charset: column for column, charset in self.charsets().items()}
+        )
+
+    def column(self, char):
+        intervals = self.intervals
+        starts = intervals[::3]
+        code = char if isinstance(char, int) else ord(char)
+        i = bisect_right(starts, code) - 1
+        if i >= 0 and code <= intervals[3 * i + 1]:
+            return intervals[3 * i + 2]
+        return 0
+
+    def move(self, states, column):
+        """Estados a los que se llega desde `states` con `column`."""
+        width = self.width
+        if self.deterministic:
+            targets = (self.transitions[state * width + column] for state in states)
+            return {target for target in targets if target >= 0}
+        offsets, transitions = self.offsets, self.transitions
+        return {
+            target
+            for state in states
+            for target in transitions[
+                offsets[state * width + column] : offsets[state * width + column + 1]
+            ]
+        }
+
+    def epsilon_closure(self, states):
+        closure = set(states)
+        pending = list(states)
+        while pending and not self.deterministic:
+            for target in self.move([pending.pop()], 0):
+                if target not in closure:
+                    closure.add(target)
+                    pending.append(target)
+        return closure
+
+    def recognize(self, string):
+        states = self.epsilon_closure({self.start})
+        for char in string:
+            states = self.epsilon_closure(self.move(states, self.column(char)))
+            if not states:
+                return False
+        return any(self.final[state] for state in states)
+
+    def to_automaton(self):
+        """`DFA` o `NFA` equivalente, con un CharSet por columna como símbolo."""
+        symbols = self.charsets()
+        symbols[0] = ""
+
+        finals = [state for state in range(self.states) if self.final[state]]
+        transitions = {}
+        for state in range(self.states):
+            for column, symbol in symbols.items():
+                targets = self.move([state], column)
+                if targets:
+                    transitions[state, symbol] = (
+                        targets.pop() if self.deterministic else list(targets)
+                    )
+        if self.deterministic:
+            return DFA(self.states, finals, transitions, self.start)
+        return NFA(self.states, finals, transitions, self.start)
+
+
+def unpack(buffer, copy=False):
+    """`PackedAutomaton` sobre `buffer` (bytes, memoryview o mmap)."""
+    return PackedAutomaton(buffer, copy)
@@ -1,4 +1,7 @@
+import sys
 import pydot
+from array import array
+from bisect import bisect_left, bisect_right
 from src.cmp.utils import ContainerSet, DisjointSet
 
 
@@ -18,6 +21,20 @@ class NFA:
 
         self.vocabulary.discard("")
 
+    def alphabet_classes(self):
+        """Agrupa el vocabulario en clases de equivalencia de caracteres (ver
+        `alphabet_classes`). Devuelve el diccionario símbolo -> clase y la cantidad de
+        clases, contando la clase 0 de los símbolos fuera del vocabulario."""
+        columns = {
+            symbol: [
+                tuple(self.transitions[state].get(symbol, ()))
+                for state in range(self.states)
+            ]
+            for symbol in self.vocabulary
+        }
+        classes, signatures = alphabet_classes(columns)
+        return classes, len(signatures) + 1
+
     def epsilon_transitions(self, state):
         assert state in self.transitions, "Invalid state"
         try:
@@ -63,9 +80,43 @@ class DFA(NFA):
         transitions = {key: [value] for key, value in transitions.items()}
         NFA.__init__(self, states, finals, transitions, start)
         self.current = start
+        self._intervals = None
+
+    def table(self):
+        """Tabla densa de `estados x clases`: `transitions[state * width + cls]` es el
+        destino o -1. Devuelve `(classes, width, transitions)`; los caracteres que no
+        están en `classes` pertenecen a la clase 0, que no tiene transiciones."""
+        classes, width = self.alphabet_classes()
+        transitions = array("i", [-1]) * (self.states * width)
+        for state in range(self.states):
+            for symbol, (target,) in self.transitions[state].items():
+                transitions[state * width + classes[symbol]] = target
+        return classes, width, transitions
 
     def _move(self, symbol):
-        self.current = self.transitions[self.current][symbol][0]
+        transitions = self.transitions[self.current]
+        try:
+            self.current = transitions[symbol][0]
+        except KeyError:
+            self.current = transitions[self.charset(symbol)][0]
+
+    def charset(self, char):
+        """Símbolo CharSet del vocabulario que contiene a `char`, o None. Los CharSet
+        de un mismo autómata son disjuntos, así que se busca por bisección en todos
+        sus intervalos a la vez."""
+        if self._intervals is None:
+            self._intervals = sorted(
+                (lo, hi, symbol)
+                for symbol in self.vocabulary
+                if isinstance(symbol, CharSet)
+                for lo, hi in symbol.intervals
+            )
+            self._starts = [lo for lo, _, _ in self._intervals]
+        code = ord(char)
+        i = bisect_right(self._starts, code) - 1
+        if i >= 0 and code <= self._intervals[i][1]:
+            return self._intervals[i][2]
+        return None
 
     def _reset(self):
         self.current = self.start
@@ -81,6 +132,230 @@ class DFA(NFA):
         return self.current in self.finals
 
 
+def alphabet_classes(columns):
+    """
+    Agrupa los símbolos en clases de equivalencia: dos símbolos son equivalentes si
+    llevan cada estado al mismo destino. `columns[symbol]` es la secuencia de destinos
+    de `symbol` desde cada estado.
+
+    Las clases se numeran desde 1; la 0 queda para los símbolos fuera del alfabeto (el
+    resto de Unicode), que no tienen transiciones. Devuelve el diccionario símbolo ->
+    clase y la lista con la columna de cada clase (la clase `c` está en `c - 1`).
+    """
+    classes = {}
+    signatures = {}
+    for symbol, column in columns.items():
+        classes[symbol] = signatures.setdefault(tuple(column), len(signatures) + 1)
+    return classes, list(signatures)
+
+
+class CharSet:
+    """
+    Conjunto de caracteres como una tupla de intervalos de códigos `(inicio, fin)`,
+    ordenados, disjuntos y con los extremos incluidos. La pertenencia se resuelve por
+    bisección, así que una clase como `[a-zA-Z0-9_]` o un conjunto negado sobre todo
+    Unicode es un solo símbolo del autómata y no una transición por carácter.
+    """
+
+    def __init__(self, intervals=()):
+        merged = []
+        for lo, hi in sorted(intervals):
+            if merged and lo <= merged[-1][1] + 1:
+                if hi > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], hi)
+            elif lo <= hi:
+                merged.append((lo, hi))
+        self.intervals = tuple(merged)
+        self.starts = tuple(lo for lo, _ in merged)
+        self._hash = hash(self.intervals)
+
+    @staticmethod
+    def of(chars):
+        """Conjunto con los caracteres de `chars`."""
+        return CharSet((ord(c), ord(c)) for c in chars)
+
+    def __contains__(self, char):
+        code = char if isinstance(char, int) else ord(char)
+        i = bisect_right(self.starts, code) - 1
+        return i >= 0 and code <= self.intervals[i][1]
+
+    def __len__(self):
+        return sum(hi - lo + 1 for lo, hi in self.intervals)
+
+    def __bool__(self):
+        return bool(self.intervals)
+
+    def __or__(self, other):
+        return CharSet(self.intervals + other.intervals)
+
+    def __and__(self, other):
+        a, b = self.intervals, other.intervals
+        intervals = []
+        i = j = 0
+        while i < len(a) and j < len(b):
+            lo, hi = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+            if lo <= hi:
+                intervals.append((lo, hi))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return CharSet(intervals)
+
+    def __invert__(self):
+        intervals = []
+        lo = 0
+        for start, end in self.intervals:
+            if start > lo:
+                intervals.append((lo, start - 1))
+            lo = end + 1
+        if lo <= sys.maxunicode:
+            intervals.append((lo, sys.maxunicode))
+        return CharSet(intervals)
+
+    def __sub__(self, other):
+        return self & ~other
+
+    def __eq__(self, other):
+        if not isinstance(other, CharSet):
+            return NotImplemented
+        return self.intervals == other.intervals
+
+    def __hash__(self):
+        return self._hash
+
+    def __lt__(self, other):
+        return self.intervals < other.intervals
+
+    def __str__(self):
+        if len(self.intervals) == 1 and self.intervals[0][0] == self.intervals[0][1]:
+            return chr(self.intervals[0][0])
+        return "[%s]" % "".join(
+            chr(lo) if lo == hi else f"{chr(lo)}-{chr(hi)}" for lo, hi in self.intervals
+        )
+
+    def __repr__(self):
+        return f"CharSet({self.intervals!r})"
+
+
+def charset_partition(sets):
+    """
+    Parte los CharSet de `sets` en átomos disjuntos: dos caracteres van al mismo átomo
+    si pertenecen exactamente a los mismos conjuntos. Se recorren los extremos de los
+    intervalos en orden, así el costo depende de la cantidad de intervalos y no de la
+    de caracteres. Devuelve el diccionario conjunto -> lista de sus átomos.
+    """
+    sets = sorted(set(sets))
+    points = sorted({p for s in sets for lo, hi in s.intervals for p in (lo, hi + 1)})
+
+    ## covers[k]: conjuntos que contienen el segmento [points[k], points[k + 1])
+    covers = [[] for _ in points]
+    for n, charset in enumerate(sets):
+        for lo, hi in charset.intervals:
+            for k in range(bisect_left(points, lo), bisect_left(points, hi + 1)):
+                covers[k].append(n)
+
+    atoms = {}
+    for k, cover in enumerate(covers):
+        if cover:
+            atoms.setdefault(tuple(cover), []).append((points[k], points[k + 1] - 1))
+
+    result = {charset: [] for charset in sets}
+    for cover, intervals in atoms.items():
+        atom = CharSet(intervals)
+        for n in cover:
+            result[sets[n]].append(atom)
+    return result
+
+
+def split_symbols(automata):
+    """
+    Reescribe los DFAs de `automata`, cuyos símbolos son CharSet, para que compartan un
+    mismo alfabeto de átomos disjuntos (ver `charset_partition`): cada transición por un
+    CharSet se reparte entre sus átomos. Así se pueden unir y determinizar juntos
+    comparando los símbolos por igualdad.
+    """
+    atoms = charset_partition(
+        symbol for automaton in automata for symbol in automaton.vocabulary
+    )
+    result = []
+    for automaton in automata:
+        transitions = {}
+        for (origin, symbol), (target,) in automaton.map.items():
+            for atom in atoms[symbol]:
+                transitions[origin, atom] = target
+        result.append(
+            DFA(automaton.states, automaton.finals, transitions, automaton.start)
+        )
+    return result
+
+
+def merge_charsets(automaton):
+    """
+    DFA equivalente a `automaton`, cuyos símbolos son CharSet, en el que los símbolos de
+    una misma clase de `alphabet_classes` (los que llevan cada estado al mismo destino)
+    se unen en un solo CharSet. Los símbolos siguen siendo disjuntos.
+    """
+    classes, _ = automaton.alphabet_classes()
+    merged = {}
+    for symbol, cls in classes.items():
+        merged[cls] = merged[cls] | symbol if cls in merged else symbol
+
+    transitions = {
+        (origin, merged[classes[symbol]]): target
+        for (origin, symbol), (target,) in automaton.map.items()
+    }
+    return DFA(automaton.states, automaton.finals, transitions, automaton.start)
+
+
+class ClassMap:
+    """
+    Clase de cada carácter en las tablas de un lexer, a partir de `charsets`, que asocia
+    a cada CharSet (disjuntos entre sí) su clase. Los caracteres fuera de todo
+    intervalo son de la clase 0.
+
+    `chars` es un diccionario carácter -> clase con los caracteres ASCII registrados de
+    antemano, también por su código para los buffers de bytes; el resto se busca por
+    bisección en los intervalos la primera vez que se consulta (`map[char]`) y se
+    memoriza en `chars`. En un buffer de bytes, un byte no ASCII se clasifica como el
+    carácter de su mismo código: los bytes de un carácter UTF-8 dentro de una cadena o
+    un comentario caen en el conjunto negado igual que el carácter en un str.
+    """
+
+    def __init__(self, charsets):
+        self.intervals = sorted(
+            (lo, hi, cls)
+            for charset, cls in charsets.items()
+            for lo, hi in charset.intervals
+        )
+        self.starts = [lo for lo, _, _ in self.intervals]
+        self.chars = {}
+        for code in range(128):
+            self.chars[chr(code)] = self.chars[code] = self.classify(code)
+
+    def classify(self, code):
+        """Clase del carácter de código `code`."""
+        i = bisect_right(self.starts, code) - 1
+        if i >= 0 and code <= self.intervals[i][1]:
+            return self.intervals[i][2]
+        return 0
+
+    def charset(self, classes):
+        """CharSet con los caracteres de las clases de `classes`."""
+        charset = CharSet((lo, hi) for lo, hi, cls in self.intervals if cls in classes)
+        if 0 in classes:
+            charset |= ~CharSet((lo, hi) for lo, hi, _ in self.intervals)
+        return charset
+
+    def __getitem__(self, char):
+        try:
+            return self.chars[char]
+        except KeyError:
+            code = char if isinstance(char, int) else ord(char)
+            cls = self.chars[char] = self.classify(code)
+            return cls
+
+
 def move(automaton, states, symbol):
     moves = set()
     for state in states:
@@ -106,40 +381,89 @@ def epsilon_closure(automaton, states):
 
 
 def nfa_to_dfa(automaton):
+    """
+    Construcción de subconjuntos. Los conjuntos de estados del NFA se representan como
+    máscaras de bits (el bit `s` es el estado `s`) y los estados del DFA ya
+    descubiertos se indexan por su máscara en un diccionario. La clausura de cada
+    estado y sus movimientos por cada clase de caracteres se calculan una sola vez.
+    """
     transitions = {}
 
-    start = epsilon_closure(automaton, [automaton.start])
-    start.id = 0
-    start.is_final = any(s in automaton.finals for s in start)
+    ## Basta con calcular un movimiento por clase de caracteres equivalentes
+    groups = {}
+    for symbol, cls in automaton.alphabet_classes()[0].items():
+        groups.setdefault(cls, []).append(symbol)
+    groups = list(groups.values())
+
+    closures = {}
+
+    def closure(state):
+        try:
+            return closures[state]
+        except KeyError:
+            pass
+        mask = 1 << state
+        pending = [state]
+        while pending:
+            for target in automaton.epsilon_transitions(pending.pop()):
+                if not mask >> target & 1:
+                    mask |= 1 << target
+                    pending.append(target)
+        closures[state] = mask
+        return mask
+
+    steps = {}
+
+    def step(state):
+        """Pares `(grupo, máscara)` con la clausura de los destinos de `state`."""
+        try:
+            return steps[state]
+        except KeyError:
+            pass
+        moves = []
+        for group, symbols in enumerate(groups):
+            mask = 0
+            for target in automaton.transitions[state].get(symbols[0], ()):
+                mask |= closure(target)
+            if mask:
+                moves.append((group, mask))
+        steps[state] = moves
+        return moves
+
+    start = closure(automaton.start)
+    index = {start: 0}
     states = [start]
 
     pending = [start]
     while pending:
-        state = pending.pop()
+        mask = pending.pop()
+        origin = index[mask]
 
-        for symbol in automaton.vocabulary:
-            trans = epsilon_closure(automaton, move(automaton, state, symbol))
+        targets = [0] * len(groups)
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            for group, moves in step(low.bit_length() - 1):
+                targets[group] |= moves
 
+        for group, trans in enumerate(targets):
             if not trans:
                 continue
 
-            for s in states:
-                if trans == s:
-                    trans = s
-                    break
-            else:
-                trans.id = len(states)
-                trans.is_final = any(s in automaton.finals for s in trans)
+            try:
+                target = index[trans]
+            except KeyError:
+                target = index[trans] = len(states)
                 states.append(trans)
                 pending.append(trans)
 
-            try:
-                transitions[state.id, symbol]
-                assert False, "Invalid DFA!!!"
-            except KeyError:
-                transitions[state.id, symbol] = trans.id
+            for symbol in groups[group]:
+                transitions[origin, symbol] = target
 
-    finals = [state.id for state in states if state.is_final]
+    final = 0
+    for state in automaton.finals:
+        final |= 1 << state
+    finals = [i for i, mask in enumerate(states) if mask & final]
     dfa = DFA(len(states), finals, transitions)
 
     return dfa
@@ -316,6 +640,56 @@ def state_minimization(automaton):
 
 
 def automata_minimization(automaton):
+    """
+    DFA mínimo equivalente a `automaton` (un DFA, posiblemente parcial), calculado con
+    el algoritmo de Hopcroft (`refine_partition`) en O(n log n) por clase de caracteres.
+    Los estados inalcanzables se descartan y el inicial pasa a ser el 0.
+    """
+    ## Los símbolos con las mismas transiciones forman una clase: basta un índice
+    ## inverso por clase, con uno de sus símbolos como representante
+    classes, _ = automaton.alphabet_classes()
+    symbols = {}
+    for symbol, cls in classes.items():
+        symbols.setdefault(cls, symbol)
+
+    inverse = {cls: {} for cls in symbols}
+    for state in range(automaton.states):
+        for cls, symbol in symbols.items():
+            destinations = automaton.transitions[state].get(symbol)
+            if destinations:
+                inverse[cls].setdefault(destinations[0], []).append(state)
+
+    ## partition = { NON-FINALS | FINALS }
+    finals = [state for state in range(automaton.states) if state in automaton.finals]
+    others = [
+        state for state in range(automaton.states) if not state in automaton.finals
+    ]
+    block = refine_partition([group for group in (finals, others) if group], inverse)
+
+    ## Un estado por bloque alcanzable, numerados en anchura desde el inicial
+    number = {block[automaton.start]: 0}
+    order = [automaton.start]
+    transitions = {}
+    for state in order:
+        origin = number[block[state]]
+        for symbol, destinations in automaton.transitions[state].items():
+            target = block[destinations[0]]
+            if not target in number:
+                number[target] = len(order)
+                order.append(destinations[0])
+            transitions[origin, symbol] = number[target]
+
+    finals = {number[block[state]] for state in finals if block[state] in number}
+    return DFA(len(order), finals, transitions)
+
+
+def iterative_minimization(automaton):
+    """
+    Minimización por rondas de `state_minimization`: en cada ronda se compara cada
+    estado con los representantes de su grupo en todo el vocabulario. Es la
+    implementación original, que se conserva como referencia para
+    `test/bench_automata.py`.
+    """
     partition = state_minimization(automaton)
 
     states = [s for s in partition.representatives]
@@ -416,3 +790,48 @@ def automata_reverse(a1):
     finals = [final]
 
     return NFA(states, finals, transitions, start)
+
+
+def refine_partition(partition, inverse):
+    """
+    Refina `partition` con el algoritmo de Hopcroft hasta que sea estable respecto
+    a todas las transiciones.
+
+    `partition` es una lista de grupos iniciales de estados e `inverse[symbol][state]`
+    los estados que llegan a `state` con `symbol`. Las transiciones pueden ser parciales,
+    por eso todos los grupos iniciales entran en la lista de divisores. Devuelve un
+    diccionario con el índice del grupo final de cada estado.
+    """
+    block = {}
+    members = []
+    for group in partition:
+        for state in group:
+            block[state] = len(members)
+        members.append(set(group))
+
+    pending = list(range(len(members)))
+    while pending:
+        splitter = list(members[pending.pop()])
+
+        for sources in inverse.values():
+            touched = {}
+            for target in splitter:
+                for state in sources.get(target, ()):
+                    touched.setdefault(block[state], set()).add(state)
+
+            for b, hit in touched.items():
+                if len(hit) == len(members[b]):
+                    continue
+
+                ## El grupo nuevo es siempre la mitad menor
+                rest = members[b] - hit
+                if len(hit) > len(rest):
+                    hit, rest = rest, hit
+
+                members[b] = rest
+                members.append(hit)
+                for state in hit:
+                    block[state] = len(members) - 1
+                pending.append(len(members) - 1)
+
+    return block
@@ -0,0 +1,94 @@
+import tempfile
+import unittest
+from src.cmp.automata import CompiledAutomaton, State
+from src.lexical_analysis.regular_expressions import (
+    Regex,
+    RegexCache,
+    followpos_automaton,
+)
+from src.tools.automata_format import pack, unpack
+from src.tools.automatas import automata_minimization, nfa_recognize, nfa_to_dfa
+
+
+class TestAutomata(unittest.TestCase):
+
+    def test_regex_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = RegexCache(maxsize=2, path=directory)
+            first = cache.get(("a|b", False), lambda: Regex.compile("a|b"))
+            self.assertIs(cache.get(("a|b", False), lambda: None), first)
+            cache.get(("c", False), lambda: Regex.compile("c"))
+            cache.get(("d", False), lambda: Regex.compile("d"))
+            self.assertNotIn(("a|b", False), cache.entries)
+            self.assertEqual(
+                cache.stats, {"hits": 1, "disk_hits": 0, "misses": 3, "size": 2}
+            )
+
+            # Otro proceso (otra caché) lo encuentra en disco
+            other = RegexCache(path=directory)
+            automaton = other.get(("a|b", False), lambda: None)
+            self.assertTrue(automaton.recognize("b"))
+            self.assertFalse(automaton.recognize("ab"))
+            self.assertEqual(other.stats["disk_hits"], 1)
+
+    def test_followpos(self):
+        # La construcción directa reconoce lo mismo que la de combinadores
+        samples = ["", "a", "b", "ab", "abb", "aabb", "c", "cc", "x1_", "1x", '"a"']
+        samples += ['"\\n"', '"\\x"', '"a\\"b"', "12.5e+3", "-0", "01", "//a b"]
+        patterns = ["(a|b)*abb", "a+b?", "(ab)+|c*", "[a-z_][a-z0-9_]*", '"([^"])*"']
+        patterns += [r"(\-|\+)?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][\+\-]?[0-9]+)?"]
+        patterns += ["//([^(\n|$)])*", "ε|a"]
+        for pattern in patterns:
+            tree = Regex.parse(pattern)
+            expected = automata_minimization(nfa_to_dfa(tree.evaluate()))
+            result = followpos_automaton(tree)
+            for sample in samples:
+                self.assertEqual(
+                    result.recognize(sample),
+                    expected.recognize(sample),
+                    (pattern, sample),
+                )
+
+    def test_subset_construction(self):
+        # El n-ésimo carácter desde el final es `a`: el DFA tiene 2^(n+1) + 1 estados
+        nfa = Regex.parse("(a|b)*a" + "(a|b)" * 8).evaluate()
+        dfa = nfa_to_dfa(nfa)
+        self.assertEqual(dfa.states, 513)
+        for sample in ["a" * 9, "b" + "a" + "b" * 8, "ab" * 6, "b" * 9]:
+            self.assertEqual(dfa.recognize(sample), sample[-9] == "a", sample)
+
+    def test_compiled_automaton(self):
+        # Los estados son enteros y las vistas reproducen la interfaz de State
+        dfa = nfa_to_dfa(Regex.parse("(a|b)*abb").evaluate())
+        compiled = CompiledAutomaton.from_dfa(dfa)
+        self.assertEqual(len(compiled), dfa.states)
+        for sample in ["abb", "babb", "ab", "abba", ""]:
+            self.assertEqual(compiled.recognize(sample), dfa.recognize(sample), sample)
+        start = compiled[0]
+        self.assertEqual(set(start.transitions), {"a", "b"})
+        self.assertEqual(start["a"][0].id, compiled.target(0, "a"))
+        self.assertIsNone(start["c"])
+
+    def test_automata_format(self):
+        # NFA, DFA y State se leen del formato binario sin reconstruir objetos
+        nfa = Regex.parse("(a|b)*abb").evaluate()
+        dfa = Regex('"([^"])*"').automaton
+        samples = ["abb", "babb", "ab", "", '"año"', '"a"b"', '"\\n"']
+        cases = [
+            (nfa, lambda sample: nfa_recognize(nfa, sample)),
+            (dfa, dfa.recognize),
+            (State.from_nfa(dfa), dfa.recognize),
+        ]
+        for automaton, recognize in cases:
+            packed = unpack(pack(automaton, meta={"name": "test"}))
+            self.assertEqual(packed.meta, {"name": "test"})
+            self.assertIsInstance(packed.transitions, memoryview)
+            restored = packed.to_automaton()
+            for sample in samples:
+                self.assertEqual(packed.recognize(sample), recognize(sample), sample)
+                if packed.deterministic:
+                    self.assertEqual(restored.recognize(sample), recognize(sample))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Compara la minimización de Hopcroft (`automata_minimization`) con la implementación
+por rondas (`iterative_minimization`).
+
+Uso:
+
+    python test/bench_automata.py
+"""
+
+import sys
+import os
+import time
+import random
+
+current_dir = os.getcwd()
+sys.path.insert(0, current_dir)
+
+from src.lexical_analysis.regular_expressions import Regex
+from src.tools.automatas import (
+    DFA,
+    automata_minimization,
+    iterative_minimization,
+    nfa_to_dfa,
+)
+
+
+def random_dfa(states, alphabet, seed=0):
+    """DFA parcial aleatorio con muchos estados equivalentes: cada estado copia las
+    transiciones de otro con probabilidad 1/2."""
+    rng = random.Random(seed)
+    transitions = {}
+    for state in range(states):
+        model = rng.randrange(state) if state and rng.random() < 0.5 else None
+        for symbol in alphabet:
+            if model is not None and (model, symbol) in transitions:
+                transitions[state, symbol] = transitions[model, symbol]
+            elif rng.random() < 0.9:
+                transitions[state, symbol] = rng.randrange(states)
+    finals = [state for state in range(states) if rng.random() < 0.3]
+    return DFA(states, finals, transitions)
+
+
+def subset_dfa(n):
+    """DFA de `(a|b)*a(a|b){n}` por subconjuntos, con 2^(n+1) + 1 estados."""
+    return nfa_to_dfa(Regex.parse("(a|b)*a" + "(a|b)" * n).evaluate())
+
+
+def reachable(automaton):
+    """Cantidad de estados alcanzables desde el inicial. `iterative_minimization`
+    conserva los inalcanzables, `automata_minimization` los descarta."""
+    seen = {automaton.start}
+    pending = [automaton.start]
+    while pending:
+        for (target,) in automaton.transitions[pending.pop()].values():
+            if not target in seen:
+                seen.add(target)
+                pending.append(target)
+    return len(seen)
+
+
+def measure(minimize, automaton):
+    start = time.perf_counter()
+    result = minimize(automaton)
+    return time.perf_counter() - start, reachable(result)
+
+
+def main():
+    cases = [(f"random {n}", random_dfa(n, "abcdefgh")) for n in (100, 200, 400, 800)]
+    cases += [(f"(a|b)*a(a|b){{{n}}}", subset_dfa(n)) for n in (4, 6, 8)]
+
+    print(f"{'automata':<20}{'estados':>8}{'mínimo':>8}{'rondas':>10}{'hopcroft':>10}")
+    for name, automaton in cases:
+        iterative, expected = measure(iterative_minimization, automaton)
+        hopcroft, states = measure(automata_minimization, automaton)
+        assert states == expected, (name, states, expected)
+        print(
+            f"{name:<20}{automaton.states:>8}{states:>8}"
+            f"{iterative:>9.3f}s{hopcroft:>9.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
+import io
+import os
+import sys
+import tempfile
 import unittest
 from src.cmp.utils import Token
-from src.lexical_analysis.lexer import Lexer
+from src.lexical_analysis import lexgen
+from src.lexical_analysis.lexer import GeneratedLexer, LazyLexer, Lexer
 from src.lexical_analysis.regex_patterns import build_regex
+from src.lexical_analysis.regular_expressions import Regex
+from src.tools.automatas import CharSet
 
 
 class TestLexer(unittest.TestCase):
@@ -414,6 +421,416 @@ class TestLexer(unittest.TestCase):
             ],
         )
 
+    def test_priority(self):
+        # Ante lexemas de igual longitud gana el patrón que aparece primero en la tabla
+        lexer = Lexer(
+            [
+                ("if", "if"),
+                ("id", "[a-zA-Z_][a-zA-Z0-9_]*"),
+                ("space", " *"),
+            ],
+            "eof",
+        )
+        result_tokens = lexer("if iff i")
+        self.assertEqual(
+            [(token.lex, token.token_type) for token in result_tokens],
+            [("if", "if"), ("iff", "id"), ("i", "id"), ("$", "eof")],
+        )
+        self.assertEqual(
+            [token.location for token in result_tokens],
+            [(1, 1), (1, 4), (1, 8), (1, 9)],
+        )
+
+    def test_offsets(self):
+        # Los tokens guardan offsets sobre el buffer y el lexema se extrae al leerlo
+        lexer = Lexer(
+            [
+                ("id", "[a-zA-Z_][a-zA-Z0-9_]*"),
+                ("space", " *"),
+            ],
+            "eof",
+        )
+        text = "let x  foo"
+        for source in (text, text.encode(), memoryview(text.encode())):
+            result_tokens = lexer.scan(source)
+            self.assertEqual(
+                [(token.start, token.end) for token in result_tokens[:-1]],
+                [(0, 3), (4, 5), (7, 10)],
+            )
+            self.assertEqual(
+                [token.lex for token in result_tokens], ["let", "x", "foo", "$"]
+            )
+
+    def test_stream(self):
+        # Los lexemas partidos entre bloques se completan con el bloque siguiente
+        lexer = Lexer(
+            [
+                ("colon", ":"),
+                ("destroy", ":="),
+                ("id", "[a-zA-Z_][a-zA-Z0-9_]*"),
+                ("lit", '"([^"])*"'),
+                ("space", " *"),
+            ],
+            "eof",
+        )
+        text = 'x := "hola mundo" : y'
+        expected_tokens = lexer(text)
+        for chunk_size in (1, 2, 3, 5, 100):
+            result_tokens = list(lexer.stream(io.StringIO(text), chunk_size))
+            self.assertEqual(result_tokens, expected_tokens)
+            self.assertEqual(
+                [token.location for token in result_tokens],
+                [token.location for token in expected_tokens],
+            )
+
+    def test_minimization(self):
+        # Los estados que solo difieren en etiquetas perdedoras se fusionan
+        lexer = Lexer(
+            [
+                ("id", "[a-z]+"),
+                ("kw", "abc"),
+                ("num", "[0-9]+"),
+                ("space", " *"),
+            ],
+            "eof",
+        )
+        self.assertLess(len(lexer.accept), len(list(lexer.automaton)))
+        self.assertEqual(
+            [(token.lex, token.token_type) for token in lexer("abc ab 12 abcd")],
+            [("abc", "id"), ("ab", "id"), ("12", "num"), ("abcd", "id"), ("$", "eof")],
+        )
+
+    def test_character_classes(self):
+        # Las letras y dígitos que se comportan igual comparten una sola columna
+        lexer = Lexer(
+            [
+                ("id", "[a-zA-Z_][a-zA-Z0-9_]*"),
+                ("space", " *"),
+            ],
+            "eof",
+        )
+        self.assertEqual(lexer.width, 4)
+        self.assertEqual(lexer("a_1 b")[:2], [Token("a_1", "id"), Token("b", "id")])
+        # Los caracteres fuera del alfabeto caen en la clase 0, sin transiciones
+        with self.assertRaises(AssertionError):
+            lexer("año")
+
+    def test_keyword_mode(self):
+        # Las palabras clave se reclasifican tras reconocer el identificador
+        table = [
+            ("if", "if"),
+            ("id", "[a-zA-Z_][a-zA-Z0-9_]*"),
+            ("else", "else"),
+            ("arrow", "=>"),
+            ("space", " *"),
+        ]
+        lexer = Lexer(table, "eof", keywords=True)
+        self.assertEqual(set(lexer.keywords), {"if", "else"})
+        text = "if iff else => elsewhere i"
+        self.assertEqual(lexer(text), Lexer(table, "eof")(text))
+        # `else` aparece después de `id` en la tabla, así que sigue siendo un `id`
+        self.assertEqual(
+            [token.token_type for token in lexer(text)],
+            ["if", "id", "id", "arrow", "id", "id", "eof"],
+        )
+
+    def test_relex(self):
+        # Solo se vuelve a tokenizar la zona de la edición
+        lexer = Lexer(
+            [
+                ("num", "[0-9]+(\\.[0-9]+)?"),
+                ("id", "[a-zA-Z_][a-zA-Z0-9_]*"),
+                ("dot", "\\."),
+                ("space", " *"),
+                ("newline", "\n"),
+            ],
+            "eof",
+        )
+        text = "a 1.5 b\nc d e f g"
+        tokens = lexer.scan(text)
+        for offset, removed, inserted in [
+            (3, 0, "2"),
+            (4, 1, ""),
+            (0, 1, "xy\n"),
+            (8, 2, ""),
+        ]:
+            edited = text[:offset] + inserted + text[offset + removed :]
+            diff = lexer.relex(tokens, (offset, removed, inserted))
+            result_tokens = diff.apply(tokens)
+            expected_tokens = lexer.scan(edited)
+            self.assertEqual(result_tokens, expected_tokens)
+            self.assertEqual(
+                [(token.start, token.end, token.location) for token in result_tokens],
+                [(token.start, token.end, token.location) for token in expected_tokens],
+            )
+            self.assertLess(len(diff.tokens), 4)
+
+        # Las ediciones se encadenan sobre la vista que devuelve `apply`
+        for offset, removed, inserted in [(0, 0, "z "), (5, 3, ""), (1, 0, "\n")]:
+            text = text[:offset] + inserted + text[offset + removed :]
+            tokens = lexer.relex(tokens, (offset, removed, inserted)).apply(tokens)
+            self.assertEqual(tokens, lexer.scan(text))
+            self.assertEqual(
+                [token.location for token in tokens],
+                [token.location for token in lexer.scan(text)],
+            )
+
+        # Un token de error pudo leer hasta la edición aunque esté lejos de ella
+        lexer = Lexer(build_regex(), "eof", recover=True)
+        text = 'x = "abc\nd"; y'
+        tokens = lexer.scan(text)
+        for edit in [(8, 1, ""), (13, 1, "z")]:
+            offset, removed, inserted = edit
+            edited = text[:offset] + inserted + text[offset + removed :]
+            result_tokens = lexer.relex(tokens, edit).apply(tokens)
+            self.assertEqual(result_tokens, lexer.scan(edited))
+
+    def test_token_buffer(self):
+        lexer = Lexer([("id", "[a-z]+"), ("num", "[0-9]+"), ("space", " *")], "eof")
+        tokens = lexer("ab 12 c")
+
+        # Los tokens se guardan como ids de tipo y offsets
+        self.assertEqual(list(tokens.types), [0, 1, 0, 3])
+        self.assertEqual(list(tokens.starts), [0, 3, 6, 7])
+        self.assertEqual([tokens.token_types[i] for i in tokens.types][-1], "eof")
+
+        # y se leen como una lista de Token
+        self.assertEqual(len(tokens), 4)
+        self.assertEqual(tokens[1], Token("12", "num"))
+        self.assertEqual(tokens[-1].location, (1, 8))
+        self.assertEqual(tokens[:2], [Token("ab", "id"), Token("12", "num")])
+        self.assertEqual([token.lex for token in tokens], ["ab", "12", "c", "$"])
+
+    def test_multiline_location(self):
+        # Los saltos de línea dentro de un lexema también cuentan
+        lexer = Lexer(
+            [
+                ("id", "[a-z]+"),
+                ("lit", '"(a| |\n)*"'),
+                ("space", " *"),
+                ("newline", "\n"),
+            ],
+            "eof",
+        )
+        text = 'ab "a\n a\n" cd\nef'
+        tokens = lexer(text)
+        self.assertEqual(
+            [token.location for token in tokens],
+            [(1, 1), (1, 4), (3, 3), (4, 1), (4, 3)],
+        )
+        self.assertEqual(
+            [token.location for token in lexer.stream(io.StringIO(text), 2)],
+            [token.location for token in tokens],
+        )
+
+    def test_fast_skip(self):
+        lexer = Lexer(build_regex(), "eof")
+        text = '  // comentario largo\nlet s = "una cadena \\" larga"   in s; // fin'
+
+        # Los estados con bucles (espacios, comentarios, cadenas) se saltan de golpe
+        skips = [skip for skip in lexer.skips[0] if skip is not None]
+        self.assertTrue(skips)
+        expected_tokens = lexer(text)
+        self.assertEqual(lexer(text.encode()), expected_tokens)
+
+        lexer.skips = [None] * len(lexer.accept), [None] * len(lexer.accept)
+        self.assertEqual(lexer(text), expected_tokens)
+        self.assertEqual(
+            [token.lex for token in expected_tokens],
+            ["let", "s", "=", '"una cadena \\" larga"', "in", "s", ";", "$"],
+        )
+
+    def test_lexgen(self):
+        lexer = Lexer(build_regex(), "eof", keywords=True)
+        text = 'let x = "a \\" b" in if (x == 12.5) print(x); // fin\nfor'
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "generated_lexer.py"), "w") as f:
+                f.write(lexgen.generate(lexer, "generated_lexer"))
+            sys.path.insert(0, directory)
+            try:
+                generated = GeneratedLexer("generated_lexer", build_regex(), "eof")
+            finally:
+                sys.path.remove(directory)
+
+        self.assertEqual(generated.lookahead, lexer.lookahead)
+        self.assertEqual(generated(text), lexer(text))
+        self.assertEqual(
+            [token.location for token in generated(text)],
+            [token.location for token in lexer(text)],
+        )
+        with self.assertRaises(AssertionError):
+            GeneratedLexer(generated.module, build_regex()[1:], "eof")
+
+    def test_symbol_table(self):
+        for keywords in (False, True):
+            lexer = Lexer(build_regex(), "eof", keywords=keywords)
+            tokens = lexer("let x = x + 1 in let y = x in y")
+            table = tokens.symbol_table
+
+            # Identificadores y palabras clave comparten id y cadena
+            self.assertEqual(sorted(table.names), ["in", "let", "x", "y"])
+            self.assertEqual(tokens[1].symbol, tokens[3].symbol)
+            self.assertIs(tokens[1].lex, tokens[3].lex)
+            self.assertEqual(table[tokens[1].symbol], "x")
+            self.assertEqual(list(tokens.symbols)[4:6], [-1, -1])
+
+            # La tabla es de la compilación: se comparte entre ficheros
+            other = lexer("x z", table)
+            self.assertEqual(other[0].symbol, tokens[1].symbol)
+            self.assertIn("z", table)
+
+    def test_recover(self):
+        text = 'let x = [1, 2] in\n  x ? "abc\nprint(#y);'
+        with self.assertRaises(AssertionError):
+            Lexer(build_regex(), "eof")(text)
+
+        # Cada error es un token y el análisis sigue en el siguiente inicio posible
+        lexer = Lexer(build_regex(), "eof", recover=True)
+        tokens = lexer(text)
+        self.assertEqual(
+            [(token.lex, token.location) for token in lexer.errors(tokens)],
+            [
+                ("[", (1, 9)),
+                ("]", (1, 14)),
+                ("?", (2, 5)),
+                ('"', (2, 7)),
+                ("#", (3, 7)),
+            ],
+        )
+        self.assertEqual(
+            [token.lex for token in tokens][9:14], ["x", "?", '"', "abc", "print"]
+        )
+        self.assertEqual(lexer.scan_parallel(text * 4, 2, 8), lexer(text * 4))
+
+        # Una racha de errores cortada entre bloques sigue siendo un solo token
+        for chunk_size in [1, 2, 3]:
+            streamed = list(lexer.stream(io.StringIO("x ### y"), chunk_size))
+            self.assertEqual(streamed, lexer("x ### y"))
+
+    def test_unicode_ranges(self):
+        # Un rango o un conjunto negado es un solo intervalo, no un carácter por arista
+        automaton = Regex("[a-zA-Z_][a-zA-Z0-9_]*").automaton
+        self.assertEqual(len(automaton.map), 3)
+        letters = CharSet([(97, 122)]) | CharSet.of("_")
+        self.assertIn("q", letters)
+        self.assertNotIn("Q", letters)
+        self.assertEqual(len(~letters) + len(letters), sys.maxunicode + 1)
+
+        lexer = Lexer(
+            [
+                ("id", "[a-zà-ÿ_][a-zà-ÿ0-9_]*"),
+                ("lit", '"([^"])*"'),
+                ("space", " *"),
+            ],
+            "eof",
+        )
+        self.assertEqual(
+            lexer('año "日本 😀" über'),
+            [Token("año", "id"), Token('"日本 😀"', "lit"), Token("über", "id")]
+            + [Token("$", "eof")],
+        )
+        # En bytes, el contenido UTF-8 de una cadena cae en el conjunto negado
+        self.assertEqual(lexer('"日本"'.encode())[0], Token('"日本"', "lit"))
+        # Aunque no sea UTF-8 válido, el lexema se puede leer
+        self.assertEqual(lexer(b'"caf\xe9"')[0].lex, '"caf\ufffd"')
+
+        # Las columnas cuentan caracteres también al leer bytes de un fichero
+        lexer = Lexer(build_regex(), "eof")
+        text = 'print("ñandú") ; x\n  "é" // ü\n y'
+        expected = [token.location for token in lexer(text)]
+        self.assertEqual(expected[5], (1, 18))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "source.hulk")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            self.assertEqual([t.location for t in lexer.scan_file(path)], expected)
+            with open(path, "rb") as f:
+                streamed = [token.location for token in lexer.stream(f, 3)]
+            self.assertEqual(streamed, expected)
+
+    def test_lazy_lexer(self):
+        # El DFA perezoso produce los mismos tokens y solo crea los estados visitados
+        table = build_regex()
+        text = 'let x = "año" in if (x == 3) print(x) else { x := 2.5e3; };'
+        expected_tokens = Lexer(table, "eof", keywords=True)(text)
+        lexer = LazyLexer(table, "eof", keywords=True)
+        self.assertEqual(lexer.stats["states"], 0)
+        self.assertEqual(lexer(text), expected_tokens)
+        self.assertEqual(lexer(text.encode()), expected_tokens)
+        misses, hits = lexer.stats["misses"], lexer.stats["hits"]
+        lexer(text)
+        self.assertEqual(lexer.stats["misses"], misses)
+        # Cada transición buscada, incluida la que falla al final de un lexema, es un
+        # acierto de la caché
+        self.assertGreater(lexer.stats["hits"] - hits, len(text))
+        # Con una caché mínima se vacía a menudo, sin cambiar el resultado
+        small = LazyLexer(table, "eof", keywords=True, max_states=2)
+        self.assertEqual(small(text), expected_tokens)
+        self.assertLessEqual(small.stats["states"], 2)
+        self.assertGreater(small.stats["flushes"], 0)
+
+        errors = LazyLexer(table, "eof", recover=True)
+        errors("#")
+        self.assertEqual((errors.stats["hits"], errors.stats["misses"]), (0, 1))
+
+    def test_scan_parallel(self):
+        # Un corte dentro de un literal multilínea se corrige al unir los bloques
+        lexer = Lexer(
+            [
+                ("id", "[a-z]+"),
+                ("lit", '"(a| |\n)*"'),
+                ("space", " *"),
+                ("newline", "\n"),
+            ],
+            "eof",
+        )
+        text = 'ab "a\na a\n" cd\nef\n"\n" gh\n' * 5
+        expected_tokens = lexer.scan(text)
+        for chunk_size in (1, 4, 9):
+            result_tokens = lexer.scan_parallel(text, 2, chunk_size)
+            self.assertEqual(result_tokens, expected_tokens)
+            self.assertEqual(
+                [(token.start, token.location) for token in result_tokens],
+                [(token.start, token.location) for token in expected_tokens],
+            )
+
+        # Los lexemas se internan en el mismo orden que en la tokenización secuencial
+        lexer = Lexer(build_regex(), "eof", keywords=True)
+        text = 'let x = "a b" in\nprint(x + y1); // z\n' * 6
+        expected_tokens = lexer.scan(text)
+        for chunk_size in (1, 5, 17):
+            result_tokens = lexer.scan_parallel(text, 2, chunk_size)
+            self.assertEqual(result_tokens, expected_tokens)
+            self.assertEqual(result_tokens.symbols, expected_tokens.symbols)
+            self.assertEqual(
+                result_tokens.symbol_table.names, expected_tokens.symbol_table.names
+            )
+
+    def test_cache(self):
+        # La segunda construcción carga las tablas de la caché sin construir autómatas
+        table = [
+            ("id", "[a-zA-Z_][a-zA-Z0-9_]*"),
+            ("space", " *"),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lexer.bin")
+            expected_tokens = Lexer(table, "eof", cache=path)("a bc")
+
+            lexer = Lexer(table, "eof", cache=path)
+            self.assertIsNone(lexer._automaton)
+            self.assertEqual(lexer("a bc"), expected_tokens)
+
+            # Si cambian los patrones la caché se reconstruye
+            lexer = Lexer(table + [("num", "[0-9]+")], "eof", cache=path)
+            self.assertIsNotNone(lexer._automaton)
+            self.assertEqual(lexer("a 12")[1], Token("12", "num"))
+
+            # Si no se puede escribir la caché el lexer funciona igual
+            path = os.path.join(directory, "missing", "lexer.bin")
+            self.assertEqual(Lexer(table, "eof", cache=path)("a bc"), expected_tokens)
+            self.assertFalse(os.path.exists(path))
+
     def test_external_code(self):
         path = "test/Data/prueba.txt"
         with open(path, "r", encoding="utf-8") as archivo:
@@ -0,0 +1,86 @@
+import io
+import unittest
+from src.cmp.pycompiler import Grammar
+from src.cmp.utils import Token
+from src.lexical_analysis.lexer import Lexer
+from src.lexical_analysis.regex_patterns import build_regex
+from src.syntax_analysis.grammLR1 import EOF, gramm_Hulk_LR1
+from src.syntax_analysis.LR1Parser import LR1Parser, build_LR1_item_sets
+
+
+def expression_grammar():
+    G = Grammar()
+    E = G.NonTerminal("E", True)
+    T, F = G.NonTerminals("T F")
+    plus, star, i, lp, rp = G.Terminals("+ * i ( )")
+    E %= E + plus + T | T
+    T %= T + star + F | F
+    F %= i | lp + E + rp
+    return G
+
+
+class TestParser(unittest.TestCase):
+
+    def test_grammar_ids(self):
+        # Al congelar la gramática los símbolos y producciones tienen ids densos
+        G = expression_grammar()
+        E, T, F = G["E"], G["T"], G["F"]
+        A = G.AugmentedGrammar(True).Freeze()
+        ids = A.SymbolIds
+        self.assertEqual(
+            A.Symbols[: A.TerminalCount],
+            (A.EOF, G["+"], G["*"], G["i"], G["("], G[")"]),
+        )
+        self.assertEqual([A.Symbols[ids[x]] for x in (E, T, F)], [E, T, F])
+        first = A.ProductionIds[G.Productions[0]]
+        self.assertEqual(A.RightIds[first], (ids[E], ids[G["+"]], ids[T]))
+        self.assertEqual(A.LeftIds[first], ids[E])
+        self.assertEqual(A.NonTerminalProductions[ids[F]], (4, 5))
+        self.assertRaises(Exception, A.Terminal, "-")
+        self.assertFalse(G.IsFrozen)
+
+    def test_lr1_item_sets(self):
+        # Colección canónica LR(1) de la gramática de expresiones
+        G = expression_grammar()
+        A = G.AugmentedGrammar(True)
+        item_sets, gotos = build_LR1_item_sets(A)
+        self.assertEqual(len(item_sets), 22)
+        ids = A.SymbolIds
+        start = A.ProductionIds[A.startSymbol.productions[0]]
+        accept = gotos[0][ids[A["E"]]]
+        self.assertEqual(item_sets[accept][start, 1], frozenset([ids[A.EOF]]))
+
+        # Congelar la copia aumentada no impide extender la gramática y reconstruir
+        E, T = G["E"], G["T"]
+        minus = G.Terminal("-")
+        E %= E + minus + T
+        B = G.AugmentedGrammar(True)
+        item_sets, gotos = build_LR1_item_sets(B)
+        accept = gotos[0][B.SymbolIds[E]]
+        self.assertIn(B.SymbolIds[minus], gotos[accept])
+        self.assertEqual(A.Symbols[A.SymbolIds[E]], E)
+        self.assertEqual(len(A.Productions), 7)
+
+    def test_token_sequences(self):
+        # El parser acepta cualquier secuencia de tokens o de tipos de token
+        lexer = Lexer(build_regex(), EOF, keywords=True)
+        parser = LR1Parser(gramm_Hulk_LR1())
+        text = "let x = 4 in print(x + 1);"
+        tokens = lexer(text)
+        expected = parser(tokens)
+
+        edit = (8, 1, "5")
+        edited = lexer.relex(tokens, edit).apply(tokens)
+        sequences = [
+            list(tokens),
+            [Token(token.lex, token.token_type) for token in tokens],
+            [token.token_type for token in tokens],
+            list(lexer.stream(io.StringIO(text), 4)),
+            edited,
+        ]
+        for sequence in sequences:
+            self.assertEqual(parser(sequence), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()